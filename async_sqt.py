@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import sys
+import socket
+import asyncore
+import collections
+import logging as log
+from sqt import Sequitur
+
+
+class Feeder( object ):
+	"""Buffers incoming bytes and appends them to a Sequitur grammar in bounded slices"""
+
+	def __init__( self, sequitur=None, slicesize=4096, highwater=65536 ):
+		if sequitur is None: sequitur = Sequitur()
+		self.s = sequitur
+		self.slicesize = slicesize
+		self.highwater = highwater
+		self.pending = collections.deque()
+		self.size = 0
+		self.processed = 0
+
+	def feed( self, data ):
+		"""queues data for the grammar.
+		   returns False if the backlog has reached the high-water mark
+		   and the producer should hold back, else True.
+		"""
+		if data:
+			self.pending.append( bytearray( data ) )
+			self.size += len( data )
+		return not self.paused()
+
+	def backlog( self ):
+		"""returns number of bytes queued but not yet in the grammar."""
+		return self.size
+
+	def paused( self ):
+		"""returns True while the backlog is at or above the high-water mark."""
+		return self.size >= self.highwater
+
+	def step( self ):
+		"""appends at most slicesize queued bytes to the grammar.
+		   returns number of bytes processed.
+		"""
+		if not self.pending: return 0
+		self.s.activate()
+		budget = self.slicesize
+		while budget and self.pending:
+			chunk = self.pending[0]
+			if len( chunk ) > budget:
+				self.pending[0] = chunk[budget:]
+				chunk = chunk[:budget]
+			else:
+				self.pending.popleft()
+			for byte in chunk:
+				self.s.append( chr(byte) )
+			budget -= len( chunk )
+		done = self.slicesize - budget
+		self.size -= done
+		self.processed += done
+		return done
+
+	def drain( self ):
+		"""processes the whole backlog. returns number of bytes processed."""
+		done = 0
+		while self.pending:
+			done += self.step()
+		return done
+
+
+class Dispatcher( asyncore.dispatcher ):
+	"""asyncore dispatcher reading a socket into a Feeder.
+	   stops reading while the feeder is paused.
+	"""
+
+	def __init__( self, sock, feeder=None, bufsize=4096, map=None ):
+		asyncore.dispatcher.__init__( self, sock, map=map )
+		if feeder is None: feeder = Feeder()
+		self.feeder = feeder
+		self.bufsize = bufsize
+
+	def readable( self ):
+		return not self.feeder.paused()
+
+	def writable( self ):
+		return False
+
+	def handle_read( self ):
+		data = self.recv( self.bufsize )
+		if data: self.feeder.feed( data )
+
+	def handle_close( self ):
+		self.close()
+
+
+def loop( dispatchers, timeout=0.05, map=None ):
+	"""runs socket i/o and grammar slices in turns until every dispatcher
+	   is closed and every feeder is drained.
+	   a busy feeder makes the poll non-blocking.
+	   dispatchers may be added to the list while the loop runs.
+	"""
+	if map is None: map = asyncore.socket_map
+	while True:
+		busy = [d.feeder for d in dispatchers if d.feeder.backlog()]
+		if not map and not busy: break
+		if map:
+			asyncore.loop( timeout=0 if busy else timeout, map=map, count=1 )
+		for f in busy:
+			f.step()
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		port = int( sys.argv[1] )
+	except:
+		log.fatal( "no port argument given" )
+		sys.exit(5)
+
+	class Server( asyncore.dispatcher ):
+		def __init__( self ):
+			asyncore.dispatcher.__init__( self )
+			self.create_socket( socket.AF_INET, socket.SOCK_STREAM )
+			self.set_reuse_addr()
+			self.bind( ( 'localhost', port ) )
+			self.listen( 5 )
+			self.clients = []
+		def handle_accept( self ):
+			pair = self.accept()
+			if pair is not None:
+				self.clients.append( Dispatcher( pair[0] ) )
+
+	server = Server()
+	try:
+		loop( server.clients, timeout=1.0 )
+	except KeyboardInterrupt:
+		for d in server.clients:
+			print d.feeder.s
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+from sqt import *
+import sqt
+import sys
+import gc
+import time
+import random
+import logging as log
+
+
+def rndstring( runs, seed=None ):
+	"""returns random string of runs of a few letters, like the fuzzer uses."""
+	rnd = random.Random( seed )
+	s = ""
+	for b in xrange( runs ):
+		char = chr( rnd.randint( 0, 3 ) + ord( 'a' ) )
+		rep = rnd.randint( 1, 5 )
+		s += char*rep
+	return s
+
+def timed( f, *args ):
+	"""returns seconds spent in f(*args)."""
+	start = time.time()
+	f( *args )
+	return time.time() - start
+
+def report( bench, variant, value, unit ):
+	print "%-20s %-12s %14.1f %s" % (bench, variant, value, unit)
+
+#########################################################################################
+def bench_small_grammars( count=2000, runs=16 ):
+	"""many small grammars: a fresh Sequitur each, with and without the
+	   full collection the reset path used to force, vs. one Sequitur
+	   reused through clear().
+	"""
+	inputs = [rndstring( runs, seed=i ) for i in xrange( count )]
+	def collect():
+		for data in inputs:
+			gc.collect()
+			s = Sequitur()
+			for c in data: s.append( c )
+	def fresh():
+		for data in inputs:
+			s = Sequitur()
+			for c in data: s.append( c )
+	def reuse():
+		s = Sequitur()
+		for data in inputs:
+			s.clear()
+			for c in data: s.append( c )
+	for variant, f in ( ('collect', collect), ('fresh', fresh), ('clear', reuse) ):
+		report( 'small_grammars', variant, count / timed( f ), "grammars/s" )
+
+def bench_index( runs=4000 ):
+	"""digram index backends: build throughput and index size on the same inputs."""
+	with open( sqt.__file__.rstrip( 'c' ) ) as f:
+		text = f.read()
+	inputs = [ ('random', rndstring( runs, seed=0 )), ('text', text) ]
+	for name, data in inputs:
+		for variant, index in ( ('Index', Index), ('ArrayIndex', ArrayIndex) ):
+			s = Sequitur( index=index() )
+			def build():
+				for c in data: s.append( c )
+			report( 'index_'+name, variant, len( data ) / timed( build ), "symbols/s" )
+			report( 'index_'+name, variant, s.index.sizeof() / 1024.0, "KiB index" )
+
+def bench_tokens( copies=4 ):
+	"""token-level vs. character-level grammars of the same text:
+	   input throughput and grammar size.
+	"""
+	import token_sqt
+	with open( sqt.__file__.rstrip( 'c' ) ) as f:
+		text = f.read() * copies
+	def chars():
+		s = Sequitur()
+		for c in text: s.append( c )
+		return s
+	def words():
+		return token_sqt.build( [text] )
+	for variant, build in ( ('chars', chars), ('words', words) ):
+		start = time.time()
+		s = build()
+		elapsed = time.time() - start
+		report( 'tokens', variant, len( text ) / elapsed, "bytes/s" )
+		report( 'tokens', variant, sum( 1 for x in s.S.walk() ) / elapsed, "symbols/s" )
+		report( 'tokens', variant, grammarsize( s ), "grammar symbols" )
+		report( 'tokens', variant, len( s.rules ), "rules" )
+
+def bench_repair( runs=4000 ):
+	"""offline Re-Pair vs. online Sequitur: build time, grammar memory and size."""
+	import repair_sqt
+	with open( sqt.__file__.rstrip( 'c' ) ) as f:
+		text = f.read()
+	inputs = [ ('random', rndstring( runs, seed=0 )), ('text', text) ]
+	def online( data ):
+		s = Sequitur()
+		for c in data: s.append( c )
+		return s
+	for name, data in inputs:
+		for variant, build in ( ('online', online), ('repair', repair_sqt.build) ):
+			start = time.time()
+			s = build( data )
+			elapsed = time.time() - start
+			report( 'repair_'+name, variant, len( data ) / elapsed, "symbols/s" )
+			report( 'repair_'+name, variant, s.memory_report()['total']['bytes'] / 1024.0, "KiB grammar" )
+			report( 'repair_'+name, variant, grammarsize( s ), "grammar symbols" )
+			report( 'repair_'+name, variant, len( s.rules ), "rules" )
+
+def bench_runs( blocks=200, seed=0 ):
+	"""run-length prefilter vs. plain characters on input padded with long runs."""
+	import run_sqt
+	rnd = random.Random( seed )
+	data = ''.join( rndstring( 8, seed=rnd.random() ) + '\0' * rnd.randint( 16, 512 ) for b in xrange( blocks ) )
+	def plain():
+		s = Sequitur()
+		for c in data: s.append( c )
+		return s
+	def runs():
+		return run_sqt.build( data )
+	for variant, build in ( ('plain', plain), ('runs', runs) ):
+		start = time.time()
+		s = build()
+		elapsed = time.time() - start
+		report( 'runs', variant, len( data ) / elapsed, "bytes/s" )
+		report( 'runs', variant, len( s.rules ), "rules" )
+
+def bench_export():
+	"""streaming export writers vs. str() of the grammar of the sqt.py text."""
+	import export_sqt
+	import cStringIO
+	with open( sqt.__file__.rstrip( 'c' ) ) as f:
+		text = f.read()
+	s = Sequitur()
+	for c in text: s.append( c )
+	class Sink( object ):
+		def write( self, chunk ): pass
+	start = time.time()
+	size = len( str( s ) )
+	report( 'export', 'str', size / (time.time() - start) / 1024.0, "KiB/s" )
+	for format in sorted( export_sqt.writers ):
+		start = time.time()
+		size = export_sqt.export( s, Sink(), format )
+		report( 'export', format, size / (time.time() - start) / 1024.0, "KiB/s" )
+
+def bench_estimate( size=131072 ):
+	"""compressibility estimate vs. full build: estimated and actual grammar
+	   ratio and decision per kind of input, and estimator speed.
+	"""
+	import zlib
+	import estimate_sqt
+	with open( sqt.__file__.rstrip( 'c' ) ) as f:
+		text = f.read()
+	rnd = random.Random( 0 )
+	inputs = [
+		( 'text', ( text * ( size // len( text ) + 1 ) )[len( text ) // 3:][:size] ),
+		( 'runs', rndstring( size // 3, seed=0 )[:size] ),
+		( 'random', ''.join( chr( rnd.randint( 0, 255 ) ) for i in xrange( size ) ) ),
+		( 'zlib', zlib.compress( text * 8 + rndstring( size, seed=1 ) )[:size] ),
+	]
+	for name, data in inputs:
+		start = time.time()
+		result = estimate_sqt.estimate( data )
+		elapsed = time.time() - start
+		s = Sequitur()
+		start = time.time()
+		for c in data: s.append( c )
+		full = time.time() - start
+		actual = float( grammarsize( s ) ) / len( data )
+		report( 'estimate_'+name, result['decision'], result['ratio'] * 100, "% estimated ratio" )
+		report( 'estimate_'+name, 'full', actual * 100, "% actual ratio" )
+		report( 'estimate_'+name, 'estimate', len( data ) / elapsed / 1024.0, "KiB/s" )
+		report( 'estimate_'+name, 'full', len( data ) / full / 1024.0, "KiB/s" )
+
+def bench_expand( copies=64 ):
+	"""restoring a grammar to a file: walk() vs. range-partitioned expansion
+	   into a memory-mapped file with growing worker counts.
+	"""
+	import os
+	import tempfile
+	import multiprocessing
+	import expand_sqt
+	with open( sqt.__file__.rstrip( 'c' ) ) as f:
+		text = f.read()
+	s = Sequitur()
+	for c in text: s.append( c )
+	for c in text * copies: s.append( c )
+	size = len( text ) * ( copies + 1 )
+	fd, filename = tempfile.mkstemp()
+	os.close( fd )
+	try:
+		def walk():
+			with open( filename, 'wb' ) as f:
+				f.write( ''.join( s.walk() ) )
+		report( 'expand', 'walk', size / timed( walk ) / 1024.0, "KiB/s" )
+		workers = 1
+		while workers <= multiprocessing.cpu_count():
+			elapsed = timed( expand_sqt.decompress, s, filename, workers )
+			report( 'expand', '%d workers' % workers, size / elapsed / 1024.0, "KiB/s" )
+			workers *= 2
+	finally:
+		os.remove( filename )
+
+benchmarks = [
+	( 'small_grammars', bench_small_grammars ),
+	( 'index', bench_index ),
+	( 'tokens', bench_tokens ),
+	( 'repair', bench_repair ),
+	( 'runs', bench_runs ),
+	( 'export', bench_export ),
+	( 'estimate', bench_estimate ),
+	( 'expand', bench_expand ),
+]
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	selected = sys.argv[1:]
+	for name, bench in benchmarks:
+		if not selected or name in selected:
+			bench()
+
+if __name__ == '__main__':
+	main()
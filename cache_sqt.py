@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import cPickle
+import hashlib
+import logging as log
+from sqt import Sequitur, Index, ArrayIndex, RuleError
+
+# what loading a truncated or garbage grammar file can raise
+corrupt = ( IOError, EOFError, cPickle.UnpicklingError, RuleError )
+
+
+class GrammarCache( object ):
+	"""On-disk cache of Sequitur grammars built from byte strings.
+	   grammars are keyed by a hash of the build parameters and the input,
+	   the least recently used ones are evicted once the cache holds more
+	   than maxbytes.
+	   an input that extends a cached one resumes from the cached grammar,
+	   so only its new tail is appended.
+	"""
+
+	catalogname = 'catalog.json'
+
+	def __init__( self, path, maxbytes=256<<20 ):
+		self.path = path
+		self.maxbytes = maxbytes
+		if not os.path.isdir( path ): os.makedirs( path )
+		self.catalog = {}
+		try:
+			with open( os.path.join( path, self.catalogname ) ) as f:
+				self.catalog = json.load( f )
+		except (IOError, ValueError):
+			pass
+		self.hits = 0
+		self.resumes = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def hasher( self, params ):
+		"""returns hash object of params, ready for the input."""
+		h = hashlib.sha1( json.dumps( params, sort_keys=True ) )
+		h.update( '\0' )
+		return h
+
+	def key( self, data, params ):
+		"""returns cache key of data built with params."""
+		h = self.hasher( params )
+		h.update( data )
+		return h.hexdigest()
+
+	def filename( self, key ):
+		return os.path.join( self.path, key + '.sqt' )
+
+	def write( self, name, write ):
+		"""writes a file atomically: calls write with a temporary file, then renames it."""
+		tmp = name + '.tmp'
+		with open( tmp, 'wb' ) as f:
+			write( f )
+		os.rename( tmp, name )
+
+	def commit( self ):
+		"""writes the catalog."""
+		self.write( os.path.join( self.path, self.catalogname ),
+			lambda f: json.dump( self.catalog, f ) )
+
+	def get( self, key, index=None ):
+		"""returns grammar cached under key, None if there is none.
+		   index is left empty if the cached grammar cannot be read.
+		"""
+		entry = self.catalog.get( key )
+		if entry is None: return None
+		try:
+			with open( self.filename( key ), 'rb' ) as f:
+				s = Sequitur.load( f, index=index )
+		except corrupt as e:
+			log.warning( "dropping unreadable cached grammar %s: %s" % (key, repr(e)) )
+			if index is not None: index.reset() # half-restored entries
+			del self.catalog[key]
+			try:
+				os.remove( self.filename( key ) )
+			except OSError:
+				pass
+			self.commit()
+			return None
+		entry['used'] = time.time()
+		return s
+
+	def put( self, key, sequitur, length, params ):
+		"""stores sequitur built from length bytes with params under key."""
+		name = self.filename( key )
+		self.write( name, sequitur.save )
+		self.catalog[key] = {
+			'length': length,
+			'params': params,
+			'size': os.path.getsize( name ),
+			'used': time.time(),
+		}
+		self.evict()
+		self.commit()
+
+	def evict( self ):
+		"""removes least recently used grammars until the cache fits maxbytes."""
+		total = sum( entry['size'] for entry in self.catalog.itervalues() )
+		for key, entry in sorted( self.catalog.items(), key=lambda item: item[1]['used'] ):
+			if total <= self.maxbytes: break
+			try:
+				os.remove( self.filename( key ) )
+			except OSError:
+				pass
+			del self.catalog[key]
+			total -= entry['size']
+			self.evictions += 1
+
+	def prefix( self, data, params ):
+		"""returns key and length of the longest cached input data starts with.
+		   data is hashed once, candidates are checked at their lengths on
+		   the way.
+		"""
+		candidates = [ (entry['length'], key) for key, entry in self.catalog.iteritems()
+			if entry['params'] == params and entry['length'] < len( data ) ]
+		found = ( None, 0 )
+		h = self.hasher( params )
+		at = 0
+		digest = h.hexdigest()
+		for length, key in sorted( candidates ):
+			if length > at:
+				h.update( buffer( data, at, length - at ) )
+				at = length
+				digest = h.copy().hexdigest()
+			if digest == key: found = ( key, length )
+		return found
+
+	def build( self, data, index=None ):
+		"""returns grammar of byte string data and how it was obtained:
+		   'hit', 'resume' or 'miss'.
+		   the grammar is cached for later builds.
+		"""
+		if index is None: index = Index()
+		params = { 'index': index.__class__.__name__ }
+		key = self.key( data, params )
+		s = self.get( key, index=index )
+		if s is not None:
+			self.hits += 1
+			self.commit() # keep the recency of the hit
+			return s, 'hit'
+		prefix, length = self.prefix( data, params )
+		s = self.get( prefix, index=index ) if prefix is not None else None
+		if s is None:
+			how = 'miss'
+			self.misses += 1
+			s = Sequitur( index=index )
+			length = 0
+		else:
+			how = 'resume'
+			self.resumes += 1
+		for i in xrange( length, len( data ) ):
+			s.append( data[i] )
+		self.put( key, s, len( data ), params )
+		return s, how
+
+	def stats( self ):
+		"""returns cache size and hit/resume/miss counters."""
+		return {
+			'grammars': len( self.catalog ),
+			'bytes': sum( entry['size'] for entry in self.catalog.itervalues() ),
+			'hits': self.hits,
+			'resumes': self.resumes,
+			'misses': self.misses,
+			'evictions': self.evictions,
+		}
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	indexes = { 'Index': Index, 'ArrayIndex': ArrayIndex }
+	try:
+		path, filename = sys.argv[1:3]
+		index = indexes[sys.argv[3] if len( sys.argv ) > 3 else 'Index']
+	except:
+		log.fatal( "usage: %s cachedir filename [%s]" % (sys.argv[0], '|'.join( indexes )) )
+		sys.exit(5)
+
+	with open( filename ) as f:
+		data = f.read()
+
+	cache = GrammarCache( path )
+	start = time.time()
+	s, how = cache.build( data, index=index() )
+	print "%-10s %s" % ('build', how)
+	print "%-10s %.3f" % ('seconds', time.time() - start)
+	for k, v in sorted( cache.stats().items() ):
+		print "%-10s %s" % (k, v)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import logging as log
+from sqt import Sequitur, grammarsize
+
+
+def windows( data, count, size ):
+	"""returns up to count windows of size bytes spread evenly over data."""
+	if len( data ) <= count * size: return [data[i:i+size] for i in xrange( 0, len( data ), size )]
+	step = ( len( data ) - size ) // ( count - 1 ) if count > 1 else 0
+	return [data[i*step:i*step+size] for i in xrange( count )]
+
+def repeated( window ):
+	"""returns the share of digrams in window that occurred before in it."""
+	if len( window ) < 2: return 0.0
+	digrams = set( window[i:i+2] for i in xrange( len( window ) - 1 ) )
+	return 1.0 - float( len( digrams ) ) / ( len( window ) - 1 )
+
+def estimate( data, count=8, size=4096, mindigrams=0.1, skip=0.9, downgrade=0.6 ):
+	"""estimates the grammar-size ratio of byte string data from count
+	   sampled windows of size bytes, without building its grammar.
+	   windows with hardly any repeated digrams count as incompressible
+	   right away, the others get a small sample grammar each. a window
+	   sees less context than the full build, so the estimate errs high.
+	   returns the estimated ratio of grammar symbols to input bytes and
+	   a decision: 'skip' at or above skip, 'downgrade' at or above
+	   downgrade, else 'build'.
+	   the grammar active before is active again afterwards.
+	"""
+	samples = windows( data, count, size )
+	active = Sequitur.active
+	s = None
+	total = 0
+	symbols = 0
+	built = 0
+	try:
+		for window in samples:
+			total += len( window )
+			if repeated( window ) < mindigrams:
+				symbols += len( window )
+				continue
+			if s is None:
+				s = Sequitur()
+			else:
+				s.clear()
+			for c in window: s.append( c )
+			symbols += grammarsize( s )
+			built += 1
+	finally:
+		if active is not None: active.activate()
+	ratio = float( symbols ) / total if total else 1.0
+	if ratio >= skip:
+		decision = 'skip'
+	elif ratio >= downgrade:
+		decision = 'downgrade'
+	else:
+		decision = 'build'
+	return { 'ratio': ratio, 'decision': decision, 'windows': len( samples ), 'built': built }
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filenames = sys.argv[1:]
+		if not filenames: raise ValueError( filenames )
+	except:
+		log.fatal( "usage: %s file [file ...]" % sys.argv[0] )
+		sys.exit(5)
+
+	for filename in filenames:
+		with open( filename ) as f:
+			data = f.read()
+		start = time.time()
+		result = estimate( data )
+		result['seconds'] = time.time() - start
+		print "%s\t%s" % (filename, json.dumps( result, sort_keys=True ))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import mmap
+import time
+import bisect
+import multiprocessing
+from array import array
+import logging as log
+from sqt import Sequitur, Rule
+
+# per-process flattened grammar, set up by setup()
+grammar = None
+
+
+class Flat( object ):
+	"""Grammar flattened for range expansion.
+	   rules are numbered from 0, the main rule first. items[r] holds the
+	   right-hand side of rule r, terminals as their text and rules as
+	   their number, and offsets[r] the byte offset of each item in the
+	   expansion. rules expanding to at most cachemax bytes keep their
+	   whole text.
+	"""
+
+	def __init__( self, sequitur, cachemax=256 ):
+		sequitur.activate()
+		decode = sequitur.decode or str
+		numbers = { sequitur.S: 0 }
+		rules = [ sequitur.S ]
+		for rule in sequitur.rules.itervalues():
+			if rule is not sequitur.S:
+				numbers[rule] = len( rules )
+				rules.append( rule )
+		self.items = []
+		for rule in rules:
+			self.items.append( [numbers[ref] if isinstance( ref, Rule ) else decode( ref ) for ref in rule.each()] )
+		# lengths bottom-up, children before their users
+		self.lengths = lengths = [None] * len( rules )
+		self.texts = texts = [None] * len( rules )
+		for r in xrange( len( rules ) ):
+			stack = [r]
+			while stack:
+				q = stack[-1]
+				if lengths[q] is not None:
+					stack.pop()
+					continue
+				pending = [x for x in self.items[q] if isinstance( x, int ) and lengths[x] is None]
+				if pending:
+					stack.extend( pending )
+					continue
+				stack.pop()
+				lengths[q] = sum( lengths[x] if isinstance( x, int ) else len( x ) for x in self.items[q] )
+				if lengths[q] <= cachemax:
+					texts[q] = ''.join( texts[x] if isinstance( x, int ) else x for x in self.items[q] )
+		self.offsets = []
+		for items in self.items:
+			offsets = array( 'l', [0] )
+			at = 0
+			for x in items:
+				at += lengths[x] if isinstance( x, int ) else len( x )
+				offsets.append( at )
+			self.offsets.append( offsets )
+
+	def __len__( self ):
+		"""returns number of bytes the main rule expands to."""
+		return self.lengths[0]
+
+	def expand( self, start, end, write ):
+		"""calls write with the bytes start to end of the expansion, in order."""
+		if start >= end: return
+		items, offsets, texts = self.items, self.offsets, self.texts
+		# descend to the item holding start
+		stack = []
+		r, base = 0, 0
+		while True:
+			i = bisect.bisect_right( offsets[r], start - base ) - 1
+			x = items[r][i]
+			if not isinstance( x, int ) or texts[x] is not None: break
+			stack.append( ( r, i, base ) )
+			base += offsets[r][i]
+			r = x
+		pos = start
+		while pos < end:
+			if i == len( items[r] ):
+				r, i, base = stack.pop()
+				i += 1
+				continue
+			x = items[r][i]
+			lo = base + offsets[r][i]
+			hi = base + offsets[r][i+1]
+			if isinstance( x, int ) and texts[x] is None:
+				stack.append( ( r, i, base ) )
+				r, i, base = x, 0, lo
+				continue
+			text = x if not isinstance( x, int ) else texts[x]
+			if lo < pos or hi > end: text = text[pos-lo:end-lo]
+			write( text )
+			pos = min( hi, end )
+			i += 1
+
+def setup( flat ):
+	global grammar
+	grammar = flat
+
+def expandrange( task ):
+	"""expands byte range start to end of the grammar into the file at filename."""
+	filename, start, end = task
+	with open( filename, 'r+b' ) as f:
+		mm = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_WRITE )
+		try:
+			mm.seek( start )
+			grammar.expand( start, end, mm.write )
+		finally:
+			mm.close()
+	return end - start
+
+def decompress( sequitur, filename, workers=None, ranges=None ):
+	"""writes the expansion of sequitur to the file at filename.
+	   the output is pre-sized and split into byte ranges, each expanded
+	   by a worker process straight into the memory-mapped file.
+	   returns number of bytes written.
+	"""
+	if workers is None: workers = multiprocessing.cpu_count()
+	flat = Flat( sequitur )
+	size = len( flat )
+	with open( filename, 'wb' ) as f:
+		f.truncate( size )
+	if not size: return 0
+	if ranges is None: ranges = max( workers, 1 ) * 4
+	step = -( -size // ranges )
+	tasks = [( filename, start, min( start + step, size ) ) for start in xrange( 0, size, step )]
+	if workers:
+		pool = multiprocessing.Pool( workers, setup, ( flat, ) )
+		try:
+			written = sum( pool.map( expandrange, tasks ) )
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		setup( flat )
+		written = sum( map( expandrange, tasks ) )
+	return written
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		grammarname, outputname = sys.argv[1:3]
+		workers = int( sys.argv[3] ) if len( sys.argv ) > 3 else None
+	except:
+		log.fatal( "usage: %s grammar output [workers]" % sys.argv[0] )
+		sys.exit(5)
+
+	with open( grammarname, 'rb' ) as f:
+		s = Sequitur.load( f )
+	start = time.time()
+	written = decompress( s, outputname, workers )
+	elapsed = time.time() - start
+	print "%-10s %s" % ('bytes', written)
+	print "%-10s %.3f" % ('seconds', elapsed)
+	print "%-10s %.0f" % ('bytes/s', written / elapsed if elapsed else 0.0)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import cStringIO
+import logging as log
+from sqt import Sequitur, Rule
+
+
+class Writer( object ):
+	"""Streams a grammar to a file object rule by rule.
+	   output is collected in a buffer written out in chunks of about
+	   bufsize bytes, so memory use does not grow with the grammar.
+	"""
+
+	def __init__( self, f, bufsize=65536 ):
+		self.f = f
+		self.bufsize = bufsize
+		self.buffer = cStringIO.StringIO()
+		self.written = 0
+		self.decode = str
+
+	def write( self, text ):
+		self.buffer.write( text )
+		if self.buffer.tell() >= self.bufsize: self.flush()
+
+	def flush( self ):
+		"""writes out the buffer."""
+		chunk = self.buffer.getvalue()
+		if chunk:
+			self.f.write( chunk )
+			self.written += len( chunk )
+		self.buffer = cStringIO.StringIO()
+
+	def terminal( self, x ):
+		return self.decode( x )
+
+	def begin( self ): pass
+	def end( self ): pass
+
+	def rule( self, rule ):
+		raise NotImplementedError
+
+	def export( self, sequitur ):
+		"""writes every rule of sequitur, main rule first. returns bytes written."""
+		sequitur.activate()
+		self.decode = sequitur.decode or str
+		self.begin()
+		self.rule( sequitur.S )
+		for rule in sequitur.rules.itervalues():
+			if rule is not sequitur.S: self.rule( rule )
+		self.end()
+		self.flush()
+		return self.written
+
+class JSONLWriter( Writer ):
+	"""one JSON object per rule: id, uses, expansion length and refs,
+	   rules given as {"rule": id}, byte terminals as latin-1 text.
+	"""
+
+	def terminal( self, x ):
+		return self.decode( x ).decode( 'latin-1' )
+
+	def rule( self, rule ):
+		self.write( '{"id": %s, "uses": %d, "length": %d, "refs": [' %
+			(json.dumps( rule.id ), rule.refcount(), rule.length()) )
+		separator = ''
+		for ref in rule.each():
+			if isinstance( ref, Rule ):
+				self.write( '%s{"rule": %s}' % (separator, json.dumps( ref.id )) )
+			else:
+				self.write( separator + json.dumps( self.terminal( ref ) ) )
+			separator = ', '
+		self.write( ']}\n' )
+
+class DOTWriter( Writer ):
+	"""Graphviz digraph: one node per rule labelled with its right-hand
+	   side, an edge to every rule it references. the graph is strict,
+	   so repeated references make one edge.
+	"""
+
+	def begin( self ):
+		self.write( 'strict digraph grammar {\n\tnode [shape=box, fontname="monospace"];\n' )
+
+	def end( self ):
+		self.write( '}\n' )
+
+	def rule( self, rule ):
+		self.write( '\t%s [label="%s:' % (rule.id, rule.id) )
+		edges = []
+		for ref in rule.each():
+			if isinstance( ref, Rule ):
+				self.write( ' ' + ref.id )
+				edges.append( '\t%s -> %s;\n' % (rule.id, ref.id) )
+			else:
+				self.write( ' ' + json.dumps( repr( self.terminal( ref ) ) )[1:-1] )
+		self.write( '"];\n' )
+		for edge in edges:
+			self.write( edge )
+
+class CSVWriter( Writer ):
+	"""one row per rule: id, uses, expansion length and the right-hand
+	   side as in str(Sequitur), quoted as csv.writer would.
+	"""
+
+	def begin( self ):
+		self.write( 'id,uses,length,rhs\r\n' )
+
+	def rule( self, rule ):
+		self.write( '%s,%d,%d,"' % (rule.id, rule.refcount(), rule.length()) )
+		separator = ''
+		for ref in rule.each():
+			if isinstance( ref, Rule ):
+				self.write( separator + ref.id )
+			else:
+				self.write( separator + repr( self.terminal( ref ) ).replace( '"', '""' ) )
+			separator = ' '
+		self.write( '"\r\n' )
+
+writers = { 'jsonl': JSONLWriter, 'dot': DOTWriter, 'csv': CSVWriter }
+
+def export( sequitur, f, format, bufsize=65536 ):
+	"""streams sequitur to file object f in format jsonl, dot or csv.
+	   returns bytes written.
+	"""
+	return writers[format]( f, bufsize ).export( sequitur )
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filename = sys.argv[1]
+		format = sys.argv[2] if len( sys.argv ) > 2 else 'jsonl'
+		if format not in writers: raise ValueError( format )
+	except:
+		log.fatal( "usage: %s filename [%s]" % (sys.argv[0], '|'.join( sorted( writers ) )) )
+		sys.exit(5)
+
+	with open( filename ) as f:
+		data = bytearray( f.read() )
+	s = Sequitur()
+	for byte in data:
+		s.append( chr(byte) )
+	start = time.time()
+	written = export( s, sys.stdout, format )
+	elapsed = time.time() - start
+	sys.stderr.write( "%d bytes in %.3fs\n" % (written, elapsed) )
+
+if __name__ == '__main__':
+	main()
@@ -3,11 +3,36 @@
 from sqt import *
 import sys
 import random
+import multiprocessing
 import unittest
 import logging as log
 log.basicConfig( level=log.WARNING )
 from IPython import embed
 
+def fuzz_verify( seed, count=1000 ):
+	"""builds count random grammars and checks each with verify() and walk().
+	   returns list of failing inputs with their problems.
+	"""
+	rnd = random.Random( seed )
+	failures = []
+	s = Sequitur()
+	for x in xrange( count ):
+		data = ""
+		for b in xrange( rnd.choice( [4, 16, 40] ) ):
+			data += chr( rnd.randint( 0, 3 ) + ord( 'a' ) ) * rnd.randint( 1, 5 )
+		s.clear()
+		try:
+			for c in data:
+				s.append( c )
+			problems = s.verify()
+			if ''.join( s.walk() ) != data:
+				problems.append( "walk mismatch" )
+		except Exception as e:
+			problems = ["crash: %s" % repr(e)]
+		if problems:
+			failures.append( (data, problems) )
+	return failures
+
 #########################################################################################
 class Test_Fuzzing_Sequitur( unittest.TestCase ):
 
@@ -44,6 +69,33 @@ class Test_Fuzzing_Sequitur( unittest.TestCase ):
 				raise
 			#self.assertEqual( [x for x in s.walk()], rnd )
 
+	def test_sequitur_fuzz_clear( self ):
+		rnd = random.Random( 29 )
+		s = self.s
+		for x in xrange( 8000 ):
+			s.clear()
+			data = ''.join( chr( rnd.randint( 0, 3 ) + ord( 'a' ) ) * rnd.randint( 1, 5 ) for b in xrange( 16 ) )
+			try:
+				for c in data:
+					s.append( c )
+			except:
+				log.error( "crash with %s after clear()" % data )
+				raise
+			self.assertEqual( ''.join( s.walk() ), data )
+
+	def test_sequitur_fuzz_verify( self ):
+		workers = multiprocessing.cpu_count()
+		pool = multiprocessing.Pool( workers )
+		try:
+			results = pool.map( fuzz_verify, xrange( workers * 4 ) )
+		finally:
+			pool.close()
+			pool.join()
+		failures = [f for result in results for f in result]
+		for data, problems in failures[:10]:
+			log.error( "invalid grammar for %s: %s" % (data, '; '.join( problems )) )
+		self.assertEqual( failures, [] )
+
 
 #########################################################################################
 if __name__ == '__main__':
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import cStringIO
+import multiprocessing
+import logging as log
+from sqt import Sequitur, grammarsize
+
+# per-process inputs and saved prefix grammars, set up by setup()
+inputs = []
+snapshots = []
+
+
+def snapshot( data ):
+	"""builds the grammar of byte string data.
+	   returns its size and the saved grammar.
+	"""
+	s = Sequitur()
+	for c in data: s.append( c )
+	f = cStringIO.StringIO()
+	s.save( f )
+	return grammarsize( s ), f.getvalue()
+
+def ncd( cx, cy, cxy ):
+	"""returns normalized compression distance from the sizes of x, y and
+	   their concatenation. pass the smaller of the sizes of xy and yx for
+	   a distance that does not depend on the order.
+	"""
+	return float( cxy - min( cx, cy ) ) / max( cx, cy, 1 )
+
+def concatsize( i, j ):
+	"""returns grammar size of input i followed by input j, resumed from
+	   the saved grammar of input i instead of rebuilding it.
+	"""
+	s = Sequitur.load( cStringIO.StringIO( snapshots[i][1] ) )
+	for c in inputs[j]: s.append( c )
+	return grammarsize( s )
+
+def setup( data, saved ):
+	global inputs, snapshots
+	inputs = data
+	snapshots = saved
+
+def pairblock( task ):
+	"""computes the distances of input i to inputs js, from both
+	   concatenation orders.
+	"""
+	i, js = task
+	distances = []
+	for j in js:
+		cxy = min( concatsize( i, j ), concatsize( j, i ) )
+		distances.append( ncd( snapshots[i][0], snapshots[j][0], cxy ) )
+	return i, js, distances
+
+
+class BatchNCD( object ):
+	"""Pairwise normalized compression distance of a corpus, with grammar
+	   size as the compressed size.
+	   per-input grammars are built once, pairs are computed in blocks by a
+	   process pool and yielded as they complete.
+	   Sequitur's grammar of xy may differ in size from that of yx, so
+	   both are built and the smaller taken: the distance is symmetric
+	   and only pairs i < j are computed.
+	"""
+
+	def __init__( self, inputs, workers=None, blocksize=16 ):
+		self.inputs = inputs
+		self.workers = workers if workers is not None else multiprocessing.cpu_count()
+		self.blocksize = blocksize
+		self.snapshots = None
+		self.pairs = 0
+		self.preparetime = 0.0
+		self.pairtime = 0.0
+
+	def tasks( self ):
+		n = len( self.inputs )
+		for i in xrange( n ):
+			for j0 in xrange( i + 1, n, self.blocksize ):
+				yield i, range( j0, min( j0 + self.blocksize, n ) )
+
+	def blocks( self ):
+		"""iterator yielding (i, js, distances) blocks of the matrix in
+		   completion order.
+		"""
+		start = time.time()
+		if self.workers:
+			pool = multiprocessing.Pool( self.workers )
+			try:
+				self.snapshots = pool.map( snapshot, self.inputs )
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			self.snapshots = map( snapshot, self.inputs )
+		self.preparetime = time.time() - start
+
+		start = time.time()
+		if self.workers:
+			pool = multiprocessing.Pool( self.workers, setup, ( self.inputs, self.snapshots ) )
+			try:
+				for block in pool.imap_unordered( pairblock, self.tasks() ):
+					self.pairs += len( block[1] )
+					self.pairtime = time.time() - start
+					yield block
+			finally:
+				pool.terminate()
+				pool.join()
+		else:
+			setup( self.inputs, self.snapshots )
+			for block in map( pairblock, self.tasks() ):
+				self.pairs += len( block[1] )
+				self.pairtime = time.time() - start
+				yield block
+
+	def matrix( self ):
+		"""returns the full symmetric distance matrix as list of lists."""
+		n = len( self.inputs )
+		m = [[0.0] * n for i in xrange( n )]
+		for i, js, distances in self.blocks():
+			for j, d in zip( js, distances ):
+				m[i][j] = m[j][i] = d
+		return m
+
+	def stats( self ):
+		"""returns pair count and throughput figures."""
+		return {
+			'inputs': len( self.inputs ),
+			'pairs': self.pairs,
+			'preparetime': self.preparetime,
+			'pairtime': self.pairtime,
+			'pairs_per_sec': self.pairs / self.pairtime if self.pairtime else 0.0,
+		}
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filenames = sys.argv[1:]
+		if len( filenames ) < 2: raise ValueError( filenames )
+	except:
+		log.fatal( "usage: %s file file [file ...]" % sys.argv[0] )
+		sys.exit(5)
+
+	data = []
+	for filename in filenames:
+		with open( filename ) as f:
+			data.append( f.read() )
+
+	batch = BatchNCD( data )
+	for i, js, distances in batch.blocks():
+		for j, d in zip( js, distances ):
+			print "%s\t%s\t%.6f" % (filenames[i], filenames[j], d)
+		sys.stdout.flush()
+	for k, v in sorted( batch.stats().items() ):
+		sys.stderr.write( "%-14s %s\n" % (k, v) )
+
+if __name__ == '__main__':
+	main()
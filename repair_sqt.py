@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import heapq
+from array import array
+import logging as log
+from sqt import Sequitur
+
+
+def pairs( seq, terminals ):
+	"""Re-Pair over integer array seq whose symbols are below terminals.
+	   repeatedly replaces the most frequent pair of adjacent symbols by a
+	   new symbol, numbered from terminals on, until no pair occurs twice.
+	   returns the remaining sequence and the list of (left, right) pairs
+	   the new symbols stand for.
+	"""
+	n = len( seq )
+	seq = array( 'l', seq )
+	nxt = array( 'l', xrange( 1, n + 1 ) )
+	prv = array( 'l', xrange( -1, n - 1 ) )
+	if n: nxt[n-1] = -1
+	# positions of each pair, possibly stale, and a heap of claimed counts.
+	# a claimed count is never below the actual one, so the pair with the
+	# highest claim that is still true after checking is the most frequent.
+	occ = {}
+	for i in xrange( n - 1 ):
+		occ.setdefault( ( seq[i], seq[i+1] ), [] ).append( i )
+	heap = [ ( -len( positions ), pair ) for pair, positions in occ.iteritems() if len( positions ) > 1 ]
+	heapq.heapify( heap )
+	rules = []
+	while heap:
+		claimed, pair = heapq.heappop( heap )
+		positions = occ.get( pair )
+		if positions is None or len( positions ) != -claimed: continue
+		a, b = pair
+		valid = []
+		last = -1
+		for i in sorted( set( positions ) ):
+			if seq[i] != a or i == last: continue
+			j = nxt[i]
+			if j < 0 or seq[j] != b: continue
+			valid.append( i )
+			last = j
+		if len( valid ) != -claimed:
+			occ[pair] = valid
+			if len( valid ) > 1: heapq.heappush( heap, ( -len( valid ), pair ) )
+			continue
+		del occ[pair]
+		new = terminals + len( rules )
+		rules.append( pair )
+		touched = set()
+		for i in valid:
+			j = nxt[i]
+			q = nxt[j]
+			seq[i] = new
+			seq[j] = -1
+			nxt[i] = q
+			if q >= 0: prv[q] = i
+			p = prv[i]
+			if p >= 0:
+				left = ( seq[p], new )
+				occ.setdefault( left, [] ).append( p )
+				touched.add( left )
+			if q >= 0:
+				right = ( new, seq[q] )
+				occ.setdefault( right, [] ).append( i )
+				touched.add( right )
+		for pair in touched:
+			positions = occ[pair]
+			if len( positions ) > 1: heapq.heappush( heap, ( -len( positions ), pair ) )
+	result = []
+	i = 0 if n else -1
+	while i >= 0:
+		result.append( seq[i] )
+		i = nxt[i]
+	return result, rules
+
+def build( data, index=None ):
+	"""builds the Re-Pair grammar of sequence data offline.
+	   returns it as a Sequitur grammar: rules used only once are inlined,
+	   so every rule is used at least twice.
+	   the grammar can be walked, printed and saved, but is not
+	   Sequitur's: a digram may occur more than once, so it is read-only
+	   and append() raises RuleError.
+	"""
+	s = Sequitur( index=index )
+	codes = {}
+	symbols = []
+	seq = array( 'l' )
+	for x in data:
+		code = codes.get( x )
+		if code is None:
+			code = codes[x] = len( symbols )
+			symbols.append( x )
+		seq.append( code )
+	terminals = len( symbols )
+	top, rules = pairs( seq, terminals )
+
+	# inline pairs used once into their user
+	uses = [0] * len( rules )
+	for x in top:
+		if x >= terminals: uses[x - terminals] += 1
+	for pair in rules:
+		for x in pair:
+			if x >= terminals: uses[x - terminals] += 1
+	def body( pair ):
+		out = []
+		stack = [pair[1], pair[0]]
+		while stack:
+			x = stack.pop()
+			if x >= terminals and uses[x - terminals] == 1:
+				stack.extend( reversed( rules[x - terminals] ) )
+			else:
+				out.append( x )
+		return out
+
+	pool = s.pool
+	made = {}
+	for k in xrange( len( rules ) ):
+		if uses[k] > 1: made[k] = pool.rule()
+	def fill( rule, refs ):
+		head = rule.guard
+		for x in refs:
+			if x >= terminals:
+				symbol = pool.ruleref( made[x - terminals] )
+			else:
+				symbol = pool.symbol( symbols[x] )
+			head.insert( symbol, learn=False )
+			head = symbol
+	for k, rule in made.iteritems():
+		fill( rule, body( rules[k] ) )
+	fill( s.S, top )
+	s.readonly = True
+	return s
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filename = sys.argv[1]
+	except:
+		log.fatal( "usage: %s filename" % sys.argv[0] )
+		sys.exit(5)
+
+	with open( filename ) as f:
+		data = f.read()
+
+	start = time.time()
+	s = build( data )
+	elapsed = time.time() - start
+	print "%-10s %s" % ('rules', len( s.rules ))
+	print "%-10s %s" % ('symbols', sum( len( rule.dump() ) for rule in s.rules.values() ))
+	print "%-10s %.3f" % ('seconds', elapsed)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import cStringIO
+import logging as log
+from sqt import Sequitur
+import trace_sqt
+
+magic = "sqt-delta 1\n"
+
+# the trace codes plus rule creation
+codes = dict( trace_sqt.codes, rule='R' )
+
+
+class ReplicationError( Exception ):
+	pass
+
+class DeltaLog( trace_sqt.TraceRecorder ):
+	"""Grammar listener writing a delta stream for replays to a file object.
+	   every symbol appended to S is written with the changes it caused:
+	   rules created, digrams replaced by rules, rules dissolved and deleted.
+	   records are batched in the trace format, sync() pushes out a partial
+	   batch.
+	"""
+
+	magic = magic
+	codes = codes
+
+	def __init__( self, f, batchsize=256 ):
+		trace_sqt.TraceRecorder.__init__( self, f, batchsize )
+		self.appended = 0
+
+	def __call__( self, event, *args ):
+		if event == 'append': self.appended += 1
+		trace_sqt.TraceRecorder.__call__( self, event, *args )
+
+	def sync( self ):
+		"""writes every record so far and flushes the file object."""
+		self.push()
+		self.flush()
+		self.f.flush()
+
+	def stats( self ):
+		"""returns delta stream size per appended symbol."""
+		return {
+			'appended': self.appended,
+			'bytes': self.written,
+			'bytes_per_symbol': float( self.written ) / self.appended if self.appended else 0.0,
+		}
+
+class Replay( object ):
+	"""Verifying replay of a delta stream on a copy of a grammar, started
+	   from a snapshot written by Sequitur.save().
+	   the recorded changes are not applied as such: Sequitur is
+	   deterministic, so the replay re-appends the symbol of each delta,
+	   doing the same work as the builder, and checks that its own changes
+	   are the recorded ones.
+	"""
+
+	def __init__( self, snapshot, index=None ):
+		if isinstance( snapshot, str ): snapshot = cStringIO.StringIO( snapshot )
+		self.s = Sequitur.load( snapshot, index=index )
+		self.events = []
+		self.s.subscribe( self.listener )
+		self.replayed = 0
+		self.replaytime = 0.0
+
+	def listener( self, event, *args ):
+		if event in codes:
+			self.events.append( ( codes[event], args[0].num if event != 'makeunique' else -1 ) )
+
+	def replay( self, records ):
+		"""re-appends the symbols of (symbol, events, rule numbers) delta records.
+		   raises ReplicationError if the replay diverges from the delta.
+		"""
+		start = time.time()
+		s = self.s
+		s.activate()
+		events = self.events
+		for symbol, recorded, nums in records:
+			del events[:]
+			s.append( symbol )
+			if ''.join( e[0] for e in events ) != recorded or tuple( e[1] for e in events ) != nums:
+				raise ReplicationError( "replay diverged at symbol %d: recorded %s%s, replayed %s" %
+					(self.replayed, recorded, nums, events) )
+			self.replayed += 1
+		self.replaytime += time.time() - start
+
+	def follow( self, f ):
+		"""replays the delta stream in file object f until its end."""
+		for record in trace_sqt.read( f, magic ):
+			self.replay( [record] )
+
+	def stats( self ):
+		"""returns replayed symbols and replay throughput."""
+		return {
+			'replayed': self.replayed,
+			'replaytime': self.replaytime,
+			'symbols_per_sec': self.replayed / self.replaytime if self.replaytime else 0.0,
+		}
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filename = sys.argv[1]
+	except:
+		log.fatal( "usage: %s filename" % sys.argv[0] )
+		sys.exit(5)
+
+	with open( filename ) as f:
+		data = f.read()
+	half = len( data ) // 2
+
+	# builder with the first half, snapshot for the replay
+	s = Sequitur()
+	for c in data[:half]: s.append( c )
+	snapshot = cStringIO.StringIO()
+	s.save( snapshot )
+
+	r, w = os.pipe()
+	pid = os.fork()
+	if pid == 0:
+		os.close( r )
+		with os.fdopen( w, 'wb' ) as out:
+			delta = DeltaLog( out )
+			s.subscribe( delta )
+			for c in data[half:]: s.append( c )
+			delta.close()
+			stats = delta.stats()
+		sys.stderr.write( "%-18s %s\n" % ('delta_bytes', stats['bytes']) )
+		sys.stderr.write( "%-18s %.3f\n" % ('bytes_per_symbol', stats['bytes_per_symbol']) )
+		os._exit(0)
+	os.close( w )
+	replay = Replay( snapshot.getvalue() )
+	with os.fdopen( r, 'rb' ) as f:
+		replay.follow( f )
+	os.waitpid( pid, 0 )
+	for k, v in sorted( replay.stats().items() ):
+		print "%-18s %s" % (k, v)
+	if ''.join( replay.s.walk() ) != data:
+		log.error( "replay does not match the input" )
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import sqlite3
+import cPickle
+import cStringIO
+import logging as log
+from collections import OrderedDict
+from sqt import Sequitur, Rule, findclass
+
+
+def address( fp ):
+	"""returns the store address of a rule fingerprint."""
+	return "%016x:%x" % fp
+
+class RuleStore( object ):
+	"""Content-addressed SQLite store of rules shared by many grammars.
+	   rules are stored under the fingerprint of their expansion, so a rule
+	   already stored for any grammar is neither encoded nor written again,
+	   and decoded rule bodies are cached across loads.
+	   a grammar is stored as its name and the address of its main rule.
+	   rules of one grammar that expand alike are stored, and loaded, as
+	   one rule.
+	"""
+
+	def __init__( self, path=':memory:', cachesize=65536 ):
+		self.db = sqlite3.connect( path, isolation_level=None )
+		self.db.execute( "CREATE TABLE IF NOT EXISTS rules ( address TEXT PRIMARY KEY, body BLOB )" )
+		self.db.execute( "CREATE TABLE IF NOT EXISTS grammars ( name TEXT PRIMARY KEY, address TEXT )" )
+		self.cachesize = cachesize
+		self.bodies = OrderedDict() # decoded bodies, least recently used first
+		self.stored = 0
+		self.shared = 0
+		self.bytes = 0
+		self.loaded = 0
+		self.cached = 0
+
+	def encode( self, refs ):
+		out = cStringIO.StringIO()
+		pickler = cPickle.Pickler( out, 2 )
+		pickler.persistent_id = lambda ref: address( ref.fingerprint() ) if isinstance( ref, Rule ) else None
+		pickler.dump( refs )
+		return out.getvalue()
+
+	def decode( self, body ):
+		"""returns list of references, rules given as (address,) tuples."""
+		unpickler = cPickle.Unpickler( cStringIO.StringIO( str( body ) ) )
+		unpickler.persistent_load = lambda addr: ( addr, )
+		unpickler.find_global = findclass
+		return unpickler.load()
+
+	def known( self, addr ):
+		if addr in self.bodies: return True
+		return self.db.execute( "SELECT 1 FROM rules WHERE address = ?", ( addr, ) ).fetchone() is not None
+
+	def put( self, name, sequitur ):
+		"""stores grammar sequitur under name. returns number of rules written."""
+		sequitur.activate()
+		written = 0
+		self.db.execute( "BEGIN" )
+		try:
+			for rule in sequitur.rules.values():
+				addr = address( rule.fingerprint() )
+				if self.known( addr ):
+					self.shared += 1
+					continue
+				body = self.encode( rule.dump() )
+				self.db.execute( "INSERT INTO rules VALUES ( ?, ? )", ( addr, sqlite3.Binary( body ) ) )
+				self.bytes += len( body )
+				written += 1
+			self.db.execute( "INSERT OR REPLACE INTO grammars VALUES ( ?, ? )",
+				( name, address( sequitur.S.fingerprint() ) ) )
+			self.db.execute( "COMMIT" )
+		except:
+			self.db.execute( "ROLLBACK" )
+			raise
+		self.stored += written
+		return written
+
+	def body( self, addr ):
+		"""returns decoded references of the rule at addr."""
+		bodies = self.bodies
+		refs = bodies.pop( addr, None )
+		if refs is None:
+			row = self.db.execute( "SELECT body FROM rules WHERE address = ?", ( addr, ) ).fetchone()
+			if row is None: raise KeyError( addr )
+			refs = self.decode( row[0] )
+			self.loaded += 1
+			if len( bodies ) >= self.cachesize: bodies.popitem( last=False )
+		else:
+			self.cached += 1
+		bodies[addr] = refs
+		return refs
+
+	def get( self, name, index=None ):
+		"""returns new grammar stored under name.
+		   rules with equal expansions are merged, so a digram may occur
+		   more than once: the grammar can be walked, printed and saved,
+		   but its digrams are not indexed and it is read-only, append()
+		   raises RuleError.
+		"""
+		row = self.db.execute( "SELECT address FROM grammars WHERE name = ?", ( name, ) ).fetchone()
+		if row is None: raise KeyError( name )
+		s = Sequitur( index=index )
+		pool = s.pool
+		made = {}
+		todo = [ ( row[0], s.S ) ]
+		while todo:
+			addr, rule = todo.pop()
+			head = rule.guard
+			for ref in self.body( addr ):
+				if isinstance( ref, tuple ):
+					target = made.get( ref[0] )
+					if target is None:
+						target = made[ref[0]] = pool.rule()
+						todo.append( ( ref[0], target ) )
+					symbol = pool.ruleref( target )
+				else:
+					symbol = pool.symbol( ref )
+				head.insert( symbol, learn=False )
+				head = symbol
+		s.readonly = True
+		return s
+
+	def names( self ):
+		"""returns names of the stored grammars."""
+		return [row[0] for row in self.db.execute( "SELECT name FROM grammars ORDER BY name" )]
+
+	def stats( self ):
+		"""returns rule counts and stored bytes."""
+		return {
+			'grammars': self.db.execute( "SELECT COUNT(*) FROM grammars" ).fetchone()[0],
+			'rules': self.db.execute( "SELECT COUNT(*) FROM rules" ).fetchone()[0],
+			'stored': self.stored,
+			'shared': self.shared,
+			'bytes': self.bytes,
+			'loaded': self.loaded,
+			'cached': self.cached,
+		}
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		path = sys.argv[1]
+		filenames = sys.argv[2:]
+		if not filenames: raise ValueError( filenames )
+	except:
+		log.fatal( "usage: %s store.db file [file ...]" % sys.argv[0] )
+		sys.exit(5)
+
+	store = RuleStore( path )
+	for filename in filenames:
+		with open( filename ) as f:
+			data = f.read()
+		s = Sequitur()
+		for c in data: s.append( c )
+		store.put( filename, s )
+	start = time.time()
+	for filename in filenames:
+		store.get( filename )
+	print "%-10s %.3f" % ('loadtime', time.time() - start)
+	for k, v in sorted( store.stats().items() ):
+		print "%-10s %s" % (k, v)
+
+if __name__ == '__main__':
+	main()
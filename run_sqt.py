@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import re
+import sys
+import time
+import logging as log
+from sqt import Sequitur, terminalclass
+
+
+@terminalclass
+class Run( tuple ):
+	"""Terminal standing for count repetitions of char."""
+
+	__slots__ = ()
+
+	def __new__( cls, char, count ):
+		return tuple.__new__( cls, ( char, count ) )
+
+	def __getnewargs__( self ):
+		return tuple( self )
+
+	char = property( lambda self: self[0] )
+	count = property( lambda self: self[1] )
+
+	def text( self ):
+		return self[0] * self[1]
+
+	def __str__( self ):
+		return "%s*%d" % (repr(self[0]), self[1])
+
+	def __repr__( self ):
+		return "Run(%s)" % str(self)
+
+def expand( x ):
+	"""decodes a terminal: runs to their characters, anything else unchanged."""
+	if isinstance( x, Run ): return x.text()
+	return x
+
+def runs( data, minrun=8 ):
+	"""iterator yielding the characters of string data, with runs of at
+	   least minrun equal characters as one Run terminal each.
+	   runs are found by the regular expression engine over the whole buffer.
+	"""
+	finder = re.compile( r'(.)\1{%d,}' % (minrun - 1), re.DOTALL )
+	at = 0
+	for m in finder.finditer( data ):
+		start, end = m.span()
+		for c in data[at:start]: yield c
+		yield Run( m.group( 1 ), end - start )
+		at = end
+	for c in data[at:]: yield c
+
+def build( data, minrun=8, index=None ):
+	"""builds the grammar of string data with runs prefiltered.
+	   walk() yields the text of runs, so joining it gives back data.
+	"""
+	s = Sequitur( index=index, decode=expand )
+	for x in runs( data, minrun ): s.append( x )
+	return s
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filename = sys.argv[1]
+		minrun = int( sys.argv[2] ) if len( sys.argv ) > 2 else 8
+		if minrun < 2: raise ValueError( minrun )
+	except:
+		log.fatal( "usage: %s filename [minrun]" % sys.argv[0] )
+		sys.exit(5)
+
+	with open( filename ) as f:
+		data = f.read()
+
+	start = time.time()
+	s = build( data, minrun )
+	elapsed = time.time() - start
+	print "%-10s %s" % ('runs', sum( 1 for x in s.S.walk() if isinstance( x, Run ) ))
+	print "%-10s %s" % ('rules', len( s.rules ))
+	print "%-10s %.0f" % ('bytes/s', len( data ) / elapsed if elapsed else 0.0)
+
+if __name__ == '__main__':
+	main()
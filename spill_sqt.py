@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+import sys
+import sqlite3
+import cPickle
+import cStringIO
+import logging as log
+from collections import OrderedDict
+from sqt import Sequitur, Rule
+
+
+class SpillStore( object ):
+	"""Keeps cold rules of a grammar in an SQLite file.
+	   rules not applied recently are spilled once more than resident rules
+	   are in memory, and faulted back in when the index or a dissolve needs
+	   them. spilling happens only between appends.
+	   a spilled rule leaves nothing but its Rule object behind: its digrams
+	   move from the index to the store, behind a fixed-size Bloom filter,
+	   and the rules it references only count it in spilledrefs.
+	"""
+
+	def __init__( self, path=':memory:', resident=4096, bloombits=1<<20 ):
+		self.path = path
+		self.resident = resident
+		self.db = sqlite3.connect( path, isolation_level=None )
+		# scratch data, no need for durability
+		self.db.execute( "PRAGMA synchronous = OFF" )
+		self.db.execute( "PRAGMA journal_mode = OFF" )
+		self.db.execute( "CREATE TABLE IF NOT EXISTS rules ( id TEXT PRIMARY KEY, body BLOB )" )
+		self.db.execute( "CREATE TABLE IF NOT EXISTS digrams ( key TEXT, rule TEXT )" )
+		self.db.execute( "CREATE INDEX IF NOT EXISTS digramkeys ON digrams ( key )" )
+		self.db.execute( "CREATE TABLE IF NOT EXISTS uses ( target TEXT, user TEXT )" )
+		self.db.execute( "CREATE INDEX IF NOT EXISTS usetargets ON uses ( target )" )
+		self.bloombits = bloombits
+		self.s = None
+		self.lru = OrderedDict() # resident rules, least recently used first
+		self.spilledrules = set()
+		self.hits = 0
+		self.misses = 0
+		self.spills = 0
+		self.lookups = 0
+
+	def attach( self, sequitur ):
+		"""binds the store to the grammar it spills for."""
+		self.s = sequitur
+		self.reset()
+
+	def reset( self ):
+		"""forgets all spilled rules."""
+		self.db.execute( "DELETE FROM rules" )
+		self.db.execute( "DELETE FROM digrams" )
+		self.db.execute( "DELETE FROM uses" )
+		for rule in self.spilledrules:
+			rule.spilled = False
+		for rule in self.s.rules.itervalues():
+			rule.spilledrefs = 0
+		self.spilledrules.clear()
+		self.lru.clear()
+		self.bloom = bytearray( self.bloombits >> 3 )
+		self.spilleddigrams = 0 # rows in digrams
+		self.bloomed = 0 # keys set in the filter since it was cleared
+
+	def touch( self, rule ):
+		"""marks rule as recently used."""
+		if rule is self.s.S: return
+		lru = self.lru
+		if rule in lru:
+			del lru[rule]
+			self.hits += 1
+		lru[rule] = None
+
+	def maintain( self ):
+		"""spills least recently used rules until few enough are resident."""
+		lru = self.lru
+		while len( lru ) > self.resident:
+			rule, _ = lru.popitem( last=False )
+			if not rule.spilled and self.s.rules.get( rule.id ) is rule:
+				self.spill( rule )
+
+	def encode( self, refs ):
+		out = cStringIO.StringIO()
+		pickler = cPickle.Pickler( out, 2 )
+		pickler.persistent_id = lambda ref: ref.id if isinstance( ref, Rule ) else None
+		pickler.dump( refs )
+		return sqlite3.Binary( out.getvalue() )
+
+	def decode( self, body ):
+		unpickler = cPickle.Unpickler( cStringIO.StringIO( str( body ) ) )
+		unpickler.persistent_load = self.s.rules.__getitem__
+		return unpickler.load()
+
+	def key( self, a, b ):
+		"""returns the store key of the digram of references a and b."""
+		return ( a.id if isinstance( a, Rule ) else repr( a ) ) + ',' + ( b.id if isinstance( b, Rule ) else repr( b ) )
+
+	def bits( self, key ):
+		"""returns the Bloom filter bit positions of key."""
+		h = hash( key )
+		m = self.bloombits
+		return ( h % m, ( h >> 21 ) % m, ( h >> 42 ) % m )
+
+	def refs( self, rule ):
+		"""returns the references of spilled rule without faulting it in."""
+		row = self.db.execute( "SELECT body FROM rules WHERE id = ?", ( rule.id, ) ).fetchone()
+		return self.decode( row[0] )
+
+	def spill( self, rule ):
+		"""moves rule's content and its index entries to the store."""
+		symbols = list( rule.eachsymbol() )
+		refs = [symbol.ref for symbol in symbols]
+		index = self.s.index
+		for symbol in symbols[:-1]:
+			index.forget( symbol )
+		keys = [self.key( refs[i], refs[i+1] ) for i in xrange( len( refs ) - 1 )]
+		bloom = self.bloom
+		for key in keys:
+			for bit in self.bits( key ):
+				bloom[bit >> 3] |= 1 << ( bit & 7 )
+		self.bloomed += len( keys )
+		self.spilleddigrams += len( keys )
+		self.db.executemany( "INSERT INTO digrams VALUES ( ?, ? )", [( key, rule.id ) for key in keys] )
+		users = []
+		for symbol in symbols:
+			if symbol.is_ruleref():
+				target = symbol.ref
+				target.refs.remove( symbol )
+				target.spilledrefs += 1
+				users.append( ( target.id, rule.id ) )
+		self.db.executemany( "INSERT INTO uses VALUES ( ?, ? )", users )
+		self.db.execute( "INSERT OR REPLACE INTO rules VALUES ( ?, ? )", ( rule.id, self.encode( refs ) ) )
+		guard = rule.guard
+		guard.l = guard
+		guard.r = guard
+		pool = self.s.pool
+		for symbol in symbols:
+			pool.release( symbol )
+		rule.spilled = True
+		self.spilledrules.add( rule )
+		self.spills += 1
+
+	def load( self, rule ):
+		"""faults spilled rule back in. returns the list of its new symbols."""
+		refs = self.refs( rule )
+		self.db.execute( "DELETE FROM rules WHERE id = ?", ( rule.id, ) )
+		self.db.execute( "DELETE FROM uses WHERE user = ?", ( rule.id, ) )
+		self.spilleddigrams -= self.db.execute( "DELETE FROM digrams WHERE rule = ?", ( rule.id, ) ).rowcount
+		rule.spilled = False
+		self.spilledrules.discard( rule )
+		pool = self.s.pool
+		guard = rule.guard
+		symbols = []
+		for ref in refs:
+			if isinstance( ref, Rule ):
+				symbol = pool.ruleref( ref )
+				ref.spilledrefs -= 1
+			else:
+				symbol = pool.symbol( ref )
+			guard.l.insert( symbol, learn=False )
+			symbols.append( symbol )
+		index = self.s.index
+		for symbol in symbols[:-1]:
+			index.add( symbol )
+		self.misses += 1
+		self.touch( rule )
+		return symbols
+
+	def lookup( self, digram ):
+		"""faults in the spilled rule holding a digram with the references
+		   of digram. returns True if there was one, else False.
+		"""
+		if not self.spilleddigrams: return False
+		key = self.key( *digram.refdigram() )
+		bloom = self.bloom
+		for bit in self.bits( key ):
+			if not bloom[bit >> 3] & 1 << ( bit & 7 ): return False
+		self.lookups += 1
+		row = self.db.execute( "SELECT rule FROM digrams WHERE key = ? LIMIT 1", ( key, ) ).fetchone()
+		if self.bloomed > 2 * self.spilleddigrams + ( self.bloombits >> 4 ): self.rebloom()
+		if row is None: return False
+		self.load( self.s.rules[row[0]] )
+		return True
+
+	def user( self, rule ):
+		"""faults in a spilled rule referencing rule. returns it."""
+		row = self.db.execute( "SELECT user FROM uses WHERE target = ? LIMIT 1", ( rule.id, ) ).fetchone()
+		user = self.s.rules[row[0]]
+		self.load( user )
+		return user
+
+	def rebloom( self ):
+		"""rebuilds the Bloom filter from the spilled digrams, dropping
+		   the bits of digrams faulted back in.
+		"""
+		bloom = self.bloom = bytearray( self.bloombits >> 3 )
+		for key, in self.db.execute( "SELECT key FROM digrams" ):
+			for bit in self.bits( key ):
+				bloom[bit >> 3] |= 1 << ( bit & 7 )
+		self.bloomed = self.spilleddigrams
+
+	def sizeof( self ):
+		"""returns bytes held in memory for the spilled rules."""
+		return sys.getsizeof( self.bloom ) + sys.getsizeof( self.spilledrules )
+
+	def stats( self ):
+		"""returns residency, spill and hit/miss counters."""
+		return {
+			'resident': len( self.s.rules ) - len( self.spilledrules ),
+			'spilled': len( self.spilledrules ),
+			'spills': self.spills,
+			'hits': self.hits,
+			'misses': self.misses,
+			'lookups': self.lookups,
+		}
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filename = sys.argv[1]
+		resident = int( sys.argv[2] ) if len( sys.argv ) > 2 else 4096
+	except:
+		log.fatal( "usage: %s filename [resident]" % sys.argv[0] )
+		sys.exit(5)
+
+	with open( filename ) as f:
+		data = bytearray( f.read() )
+
+	store = SpillStore( filename + '.spill', resident=resident )
+	s = Sequitur( store=store )
+	for byte in data:
+		s.append( chr(byte) )
+
+	for k, v in sorted( store.stats().items() ):
+		print "%-10s %s" % (k, v)
+
+if __name__ == '__main__':
+	main()
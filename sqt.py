@@ -1,8 +1,14 @@
 #!/usr/bin/env python
 
 import sys
-import gc
+import json
+import cPickle
+import copy_reg
+import hashlib
+import argparse
+import functools
 import logging as log
+from array import array
 from IPython import embed
 
 
@@ -17,6 +23,10 @@ class Symbol( object ):
 	learn = ( lambda *args, **kw: log.debug( " DUMMY learn(%s,%s)", repr(args), repr(kw) ) )
 	forget = ( lambda *args, **kw: log.debug( " DUMMY forget(%s,%s)", repr(args), repr(kw) ) )
 
+	# free list for deleted symbols, installed by Sequitur.activate(),
+	# so symbols are deleted only while their own grammar is active
+	pool = None
+
 	def __init__( self, reference ):
 		self.ref = reference
 		#log.debug( "     new symbol %s with reference to %s" % (self.debugstr(), str(reference)) )
@@ -27,10 +37,15 @@ class Symbol( object ):
 	def is_ruleref( self ): return False
 
 	def delete( self ):
-		"""frees up pointers to garbage collector."""
+		"""frees up pointers to garbage collector.
+		   hands the symbol over to the pool for reuse if there is one.
+		"""
 		#log.debug( "     deleting symbol %s" % self.debugstr() )
 		#if self.is_connected():
 		#	raise SymbolError( "connected %s cannot be deleted" % repr(self) )
+		if self.pool is not None:
+			self.pool.release( self )
+			return
 		del self.ref
 		del self.r
 		del self.l
@@ -183,27 +198,93 @@ class Ruleref( Symbol ):
 	def __str__( self ):
 		return str( self.ref.id )
 
-class Index( object ):
-	"""Class for speedy lookups of digram occurrence"""
+class DigramIndex( object ):
+	"""Interface of digram index backends.
+	   Symbol.learn and Symbol.forget are bound to an instance's learn()
+	   and forget(), its makeunique is set to Rule.makeunique by Sequitur.
+	   subclasses implement seen(), add(), forget(), reset() and sizeof().
+	"""
 
 	# callback for makeunique
 	makeunique = ( lambda *args, **kw: log.debug( " DUMMY makeunique(%s,%s)", repr(args), repr(kw) ) ) # ultimately Rule.makeunique
 
+	def seen( self, digram ):
+		"""returns first learned symbol forming the same digram, else False"""
+		raise NotImplementedError
+
+	def add( self, digram ):
+		"""records digram in the index."""
+		raise NotImplementedError
+
+	def forget( self, digram ):
+		"""removes digram from the index.
+		   raises ValueError if digram is not in the index.
+		"""
+		raise NotImplementedError
+
+	def reset( self ):
+		"""clears index"""
+		raise NotImplementedError
+
+	def sizeof( self, deep=False ):
+		"""returns estimated number of bytes held by the index,
+		   measured entry by entry if deep.
+		"""
+		raise NotImplementedError
+
+	def swap( self, old, new ):
+		"""replaces entry old by new, which forms the same digram.
+		   returns False if old is not in the index.
+		"""
+		raise NotImplementedError
+
+	def duplicates( self ):
+		"""iterator yielding, for every digram learned more than once,
+		   the list of its entries in the order they were learned.
+		"""
+		raise NotImplementedError
+
+	def learn( self, digram, makeunique=None ):
+		"""creates digram reference in the index.
+		   triggers makeunique() if digram was seen before and does not overlap.
+		"""
+		if makeunique is None: makeunique = self.makeunique
+		# If a digram contains a guard, return False
+		try:
+			seenat = self.seen( digram )
+		except SymbolError: # guard in digram
+			return False
+		if not seenat and Rule.store is not None and Rule.store.lookup( digram ):
+			seenat = self.seen( digram ) # faulted in from the store
+		self.add( digram )
+		if seenat:
+			overlap = (seenat.r is digram) or (seenat.l is digram)
+			if not overlap:
+				if makeunique: makeunique( seenat, digram )
+				return False
+		else:
+			return True
+
+class Index( DigramIndex ):
+	"""Class for speedy lookups of digram occurrence"""
+
 	def __init__( self, keyseparator=',' ):
 		self.dict = {}
 		self.keyseparator = keyseparator
+		self.entries = 0 # digrams in all lists
+		self.keychars = 0 # characters in all keys
 
 	def key( self, digram ):
 		"""returns string representing digram in the index"""
 		a,b = digram.refdigram()
 		return str( a ) + self.keyseparator + str( b )
 
-	def reset( self, keyseparator=',' ):
+	def reset( self, keyseparator=None ):
 		"""clears index"""
-		del self.dict
-		gc.collect()
-		self.dict = {}
-		self.keyseparator = keyseparator
+		self.dict.clear()
+		self.entries = 0
+		self.keychars = 0
+		if keyseparator is not None: self.keyseparator = keyseparator
 		#log.debug( " index reset" )
 
 	def seen( self, digram ):
@@ -216,32 +297,16 @@ class Index( object ):
 		#log.debug( "       index has %s at %s" % (key, repr(seenat)) )
 		return seenat[0]
 
-
-	def learn( self, digram, makeunique=None ):
-		"""creates digram reference in the dictionary.
-		   triggers makeunique() if digram was seen before and does not overlap.
-		"""
-		if makeunique is None: makeunique = self.makeunique
-		# If a digram contains a guard, return False
-		try:
-			seenat = self.seen( digram )
-		except SymbolError: # guard in digram
-			return False
-		# add to index
+	def add( self, digram ):
+		"""appends digram to the dictionary entry of its key."""
 		key = self.key( digram )
 		#log.debug( "       index learning %s at %s" % (str(key), digram.debugstr()) )
 		try:
 			self.dict[key].append( digram )
 		except:
 			self.dict[key] = [digram]
-		if seenat:
-			overlap = (seenat.r is digram) or (seenat.l is digram)
-		 	if not overlap:
-				if makeunique: makeunique( seenat, digram )
-				return False
-		else:
-			return True
-
+			self.keychars += len( key )
+		self.entries += 1
 
 	def forget( self, digram ):
 		"""removes digram from the dictionary"""
@@ -250,23 +315,222 @@ class Index( object ):
 		except SymbolError: # digram contains guard
 			return False
 		#log.debug( "       index to forgeting '%s' at %s" % (str(key), digram.debugstr()) )
-		self.dict[key].remove( digram )
+		digrams = self.dict.get( key )
+		if digrams is None:
+			raise ValueError( "digram %s not in index" % digram.debugstr() )
+		digrams.remove( digram )
+		self.entries -= 1
 		##log.debug( "       index forgetting %s" % key )
-		if len( self.dict[key] ) == 0: del self.dict[key]
+		if len( digrams ) == 0:
+			del self.dict[key]
+			self.keychars -= len( key )
 		return True
 
+	def swap( self, old, new ):
+		"""replaces entry old by new, which forms the same digram.
+		   returns False if old is not in the index.
+		"""
+		digrams = self.dict.get( self.key( old ) )
+		if digrams:
+			for i in xrange( len( digrams ) ):
+				if digrams[i] is old:
+					digrams[i] = new
+					return True
+		return False
+
+	def duplicates( self ):
+		"""iterator yielding, for every digram learned more than once,
+		   the list of its entries in the order they were learned.
+		"""
+		for digrams in self.dict.itervalues():
+			if len( digrams ) > 1: yield digrams
+
+	def sizeof( self, deep=False ):
+		"""returns bytes held by the dictionary, its keys and lists.
+		   estimated from the running counts, lists taken as one-element
+		   lists plus a pointer per further entry, unless deep.
+		"""
+		size = sys.getsizeof( self.dict )
+		if deep:
+			for key, digrams in self.dict.iteritems():
+				size += sys.getsizeof( key ) + sys.getsizeof( digrams )
+			return size
+		keys = len( self.dict )
+		return ( size + keys * ( sys.getsizeof( '' ) + sys.getsizeof( [None] ) )
+			+ self.keychars + ( self.entries - keys ) * ( sys.getsizeof( [None, None] ) - sys.getsizeof( [None] ) ) )
+
+	def __len__( self ):
+		return self.entries
+
 	def __str__( self ):
 		return ( self.dict )
 
 
-class TrivialIndex( object ):
-	"""Class for slow lookups of digram occurrence directly in the Rule set"""
+class ArrayIndex( DigramIndex ):
+	"""Open-addressing hash table over packed integer digram keys.
+	   keys, insertion sequence numbers and symbols live in flat arrays,
+	   there are no per-entry Python objects.
+	   new entries go to the first empty slot, never into a tombstone, so
+	   entries of one digram are probed in the order they were learned.
+	"""
 
-	# callback for makeunique
-	makeunique = ( lambda *args, **kw: log.debug( " DUMMY makeunique(%s,%s)", repr(args), repr(kw) ) ) # ultimately Rule.makeunique
+	EMPTY = -1
+	DELETED = -2
+	# a key packs two codes into one signed array item
+	SHIFT = array( 'l' ).itemsize * 4
+	MAXCODE = ( 1 << ( SHIFT - 1 ) ) - 1
+
+	def __init__( self, capacity=1024 ):
+		self.codes = {}
+		self.reset( capacity )
+
+	def reset( self, capacity=1024 ):
+		"""clears index"""
+		self.keys = array( 'l', [ArrayIndex.EMPTY] ) * capacity
+		self.seqs = array( 'l', [0] ) * capacity
+		self.symbols = [None] * capacity
+		self.mask = capacity - 1
+		self.used = 0 # live entries
+		self.filled = 0 # live entries and tombstones
+		self.nextseq = 0
+		self.codes.clear()
+
+	def code( self, ref ):
+		"""returns small integer code of ref. odd for rules, even for terminals."""
+		if isinstance( ref, Rule ):
+			return ( ref.num << 1 ) | 1
+		try:
+			return self.codes[ref]
+		except KeyError:
+			code = self.codes[ref] = len( self.codes ) << 1
+			return code
+
+	def locate( self, digram ):
+		"""returns packed key of digram and its home slot.
+		   raises OverflowError if a code does not fit half a key.
+		"""
+		a,b = digram.refdigram()
+		a = self.code( a )
+		b = self.code( b )
+		if a > ArrayIndex.MAXCODE or b > ArrayIndex.MAXCODE:
+			raise OverflowError( "digram codes %d,%d exceed %d bits" % (a, b, ArrayIndex.SHIFT - 1) )
+		return ( a << ArrayIndex.SHIFT ) | b, ( a * 0x9E3779B1 ^ b ) & self.mask
+
+	def seen( self, digram ):
+		"""returns first learned symbol forming the same digram, else False"""
+		key, i = self.locate( digram )
+		keys = self.keys
+		mask = self.mask
+		empty = ArrayIndex.EMPTY
+		while keys[i] != empty:
+			if keys[i] == key: return self.symbols[i]
+			i = ( i + 1 ) & mask
+		return False
+
+	def add( self, digram ):
+		"""stores digram in the first empty slot of its probe sequence."""
+		key, i = self.locate( digram )
+		self.store( key, i, self.nextseq, digram )
+		self.nextseq += 1
+		self.used += 1
+		self.filled += 1
+		if self.filled * 2 > len( self.keys ): self.resize()
+
+	def store( self, key, i, seq, digram ):
+		"""puts an entry in the first empty slot from slot i on."""
+		keys = self.keys
+		mask = self.mask
+		while keys[i] != ArrayIndex.EMPTY:
+			i = ( i + 1 ) & mask
+		keys[i] = key
+		self.seqs[i] = seq
+		self.symbols[i] = digram
+
+	def forget( self, digram ):
+		"""removes digram from the table, leaving a tombstone.
+		   raises ValueError if digram is not in the index.
+		"""
+		try:
+			key, i = self.locate( digram )
+		except SymbolError: # digram contains guard
+			return False
+		keys = self.keys
+		mask = self.mask
+		while keys[i] != ArrayIndex.EMPTY:
+			if keys[i] == key and self.symbols[i] is digram:
+				keys[i] = ArrayIndex.DELETED
+				self.symbols[i] = None
+				self.used -= 1
+				return True
+			i = ( i + 1 ) & mask
+		raise ValueError( "digram %s not in index" % digram.debugstr() )
+
+	def swap( self, old, new ):
+		"""replaces entry old by new, which forms the same digram.
+		   returns False if old is not in the index.
+		"""
+		key, i = self.locate( old )
+		keys = self.keys
+		mask = self.mask
+		while keys[i] != ArrayIndex.EMPTY:
+			if keys[i] == key and self.symbols[i] is old:
+				self.symbols[i] = new
+				return True
+			i = ( i + 1 ) & mask
+		return False
+
+	def duplicates( self ):
+		"""iterator yielding, for every digram learned more than once,
+		   the list of its entries in the order they were learned.
+		"""
+		groups = {}
+		keys = self.keys
+		for i in xrange( len( keys ) ):
+			if keys[i] >= 0:
+				groups.setdefault( keys[i], [] ).append( ( self.seqs[i], self.symbols[i] ) )
+		for entries in groups.itervalues():
+			if len( entries ) > 1:
+				entries.sort()
+				yield [symbol for seq, symbol in entries]
+
+	def resize( self ):
+		"""rehashes live entries, oldest first, into a table at most a quarter full."""
+		capacity = len( self.keys )
+		while self.used * 4 > capacity: capacity *= 2
+		keys, seqs, symbols = self.keys, self.seqs, self.symbols
+		live = [j for j in xrange( len( keys ) ) if keys[j] >= 0]
+		live.sort( key=seqs.__getitem__ )
+		self.keys = array( 'l', [ArrayIndex.EMPTY] ) * capacity
+		self.seqs = array( 'l', [0] ) * capacity
+		self.symbols = [None] * capacity
+		self.mask = capacity - 1
+		self.filled = self.used
+		mask = self.mask
+		shift = ArrayIndex.SHIFT
+		low = ( 1 << shift ) - 1
+		for j in live:
+			key = keys[j]
+			self.store( key, ( ( key >> shift ) * 0x9E3779B1 ^ ( key & low ) ) & mask, seqs[j], symbols[j] )
+
+	def sizeof( self, deep=False ):
+		"""returns bytes held by the flat arrays and the terminal codes."""
+		return ( sys.getsizeof( self.keys ) + sys.getsizeof( self.seqs )
+			+ sys.getsizeof( self.symbols ) + sys.getsizeof( self.codes ) )
+
+	def __len__( self ):
+		return self.used
+
+
+class TrivialIndex( DigramIndex ):
+	"""Class for slow lookups of digram occurrence directly in the Rule set"""
 
 	def __init__( self ): pass
+	def add( self, digram ): pass
 	def forget( self, digram ): pass
+	def reset( self ): pass
+	def sizeof( self, deep=False ): return 0
+	def swap( self, old, new ): return False
+	def duplicates( self ): return iter( () )
 	def __str__( self ): return "{TrivialIndex. See Rule set for index.}"
 
 	def seen( self, digram ):
@@ -299,58 +563,153 @@ class TrivialIndex( object ):
 class RuleError( Exception ):
 	pass
 
+# classes of terminals a saved grammar may hold besides plain data,
+# registered with terminalclass(), see Sequitur.restore()
+terminalclasses = {}
+
+def terminalclass( cls ):
+	"""registers cls as a terminal class that saved grammars may hold. returns cls."""
+	terminalclasses[( cls.__module__, cls.__name__ )] = cls
+	return cls
+
+def findclass( module, name ):
+	"""returns a registered terminal class for unpickling, refuses anything else."""
+	if ( module, name ) == ( 'copy_reg', '__newobj__' ): return copy_reg.__newobj__
+	try:
+		return terminalclasses[( module, name )]
+	except KeyError:
+		raise cPickle.UnpicklingError( "%s.%s is not a terminal class" % (module, name) )
+
+# rolling hash of rule expansions: a polynomial over terminal hashes,
+# so the fingerprint of xy follows from those of x and y
+fpmodulus = (1<<61) - 1
+fpbase = 0x5bd1e995
+# hashes of terminals, emptied with every new or cleared grammar
+fpterminals = {}
+
+def fingerprint( ref ):
+	"""returns (hash, length) of the expansion of rule or terminal ref."""
+	if isinstance( ref, Rule ): return ref.fingerprint()
+	fp = fpterminals.get( ref )
+	if fp is None:
+		digest = hashlib.md5( repr( ref ) ).digest()
+		fp = fpterminals[ref] = ( int( digest[:8].encode( 'hex' ), 16 ) % fpmodulus, 1 )
+	return fp
+
+def fpconcat( a, b ):
+	"""returns fingerprint of the concatenation of fingerprints a and b."""
+	return ( ( a[0] * pow( fpbase, b[1], fpmodulus ) + b[0] ) % fpmodulus, a[1] + b[1] )
+
 class Rule( object ):
 
 	rules = {}
 	nextid = 0
 	rulemarker = "r"
+	# free list for deleted rules, installed by Sequitur.activate()
+	pool = None
+	# store for cold rules, installed by Sequitur.activate()
+	store = None
+	# True while this rule's content lives in the store
+	spilled = False
+	# number of references to this rule held by spilled rules
+	spilledrefs = 0
+	# grammar event callbacks, installed by Sequitur.activate()
+	listeners = ()
+	# fingerprint of the expansion, see fingerprint()
+	fp = None
+	# length of the expansion, see length()
+	size = None
 
 	@classmethod
 	def reset( cls, rulemarker='r' ):
 		"""clears class-wide rule index."""
-		del cls.rules
-		gc.collect()
 		cls.rules = {}
 		cls.nextid = 0
 		cls.rulemarker = rulemarker
 		#log.debug( " Rule reset" )
 
+	@classmethod
+	def notify( cls, event, *args ):
+		"""calls every listener with event name and arguments."""
+		for listener in cls.listeners:
+			listener( event, *args )
+
 	def __init__( self, digram=None ):
-		self.id = str(Rule.rulemarker) + str(Rule.nextid)
-		#log.debug( "   new rule %s with id %s" % (self.debugstr(),str(self.id)) )
-		Rule.nextid += 1
 		self.refs = set() # must be here before guard creation
 		self.guard = Guard( self )
+		self.setup( digram )
+
+	def setup( self, digram=None ):
+		"""assigns a fresh id, registers this rule in the rule index
+		   and fills it with the references of digram.
+		"""
+		self.num = Rule.nextid
+		self.id = str(Rule.rulemarker) + str(self.num)
+		#log.debug( "   new rule %s with id %s" % (self.debugstr(),str(self.id)) )
+		Rule.nextid += 1
 		Rule.rules[self.id] = self
+		self.fp = None
+		self.size = None
 		if digram:
 			a,b = digram.refdigram()
 			self.append( a, makeunique=False )
 			self.append( b, makeunique=False )
+		if Rule.listeners: Rule.notify( 'rule', self )
 
 	def delete( self ):
 		"""removes this rule from rule index and frees references for garbage collector."""
 		#if not self.is_empty():
 		#	raise RuleError( "cannot delete non-empty rule %s" % repr(self) )
 		# dismantle rule
+		if Rule.listeners: Rule.notify( 'delete', self )
 		del Rule.rules[self.id]
+		if Rule.pool is not None:
+			Rule.pool.release( self )
+			return
 		self.guard.delete()
 		del self.guard
 		del self.refs
 
 	def is_empty( self ):
 		"""returns True if guard symbol has no neighbors, else False."""
-		return not self.guard.is_connected()
+		return not self.spilled and not self.guard.is_connected()
 
 	def nodes( self ):
 		"""returns list of this rule's guard, tail and head symbols"""
+		if self.spilled: Rule.store.load( self )
 		guard = self.guard
 		tail = guard.r
 		head = guard.l
 		return guard, tail, head
 
+	def fingerprint( self ):
+		"""returns (hash, length) of this rule's expansion.
+		   a rule's expansion never changes, so rules of any grammar with
+		   equal fingerprints expand to the same sequence. folded over the
+		   rule's content on first use and kept once the rule is referenced.
+		"""
+		if self.fp is not None: return self.fp
+		fp = ( 0, 0 )
+		for ref in self.each():
+			fp = fpconcat( fp, fingerprint( ref ) )
+		if self.refcount(): self.fp = fp
+		return fp
+
+	def length( self ):
+		"""returns number of terminals this rule expands to.
+		   kept once the rule is referenced, like fingerprint().
+		"""
+		if self.size is not None: return self.size
+		if self.fp is not None: return self.fp[1]
+		size = 0
+		for ref in self.each():
+			size += ref.length() if isinstance( ref, Rule ) else 1
+		if self.refcount(): self.size = size
+		return size
+
 	def refcount( self ):
-		"""returns number of symbols referencing this rule."""
-		return len( self.refs )
+		"""returns number of symbols referencing this rule, spilled ones included."""
+		return len( self.refs ) + self.spilledrefs
 
 	def addref( self, symbol ):
 		"""adds symbol to this rule's references set."""
@@ -375,6 +734,9 @@ class Rule( object ):
 
 	def each( self ):
 		"""iterator yielding the ordered references this rule contains."""
+		if self.spilled:
+			for ref in Rule.store.refs( self ): yield ref
+			return
 		symbol = self.guard.r
 		while not symbol.is_guard():
 			yield symbol.ref
@@ -382,6 +744,7 @@ class Rule( object ):
 
 	def eachsymbol( self ):
 		"""iterator yielding the ordered symbols this rule contains."""
+		if self.spilled: Rule.store.load( self )
 		symbol = self.guard.r
 		while not symbol.is_guard():
 			yield symbol
@@ -405,10 +768,11 @@ class Rule( object ):
 
 	def append( self, newref, makeunique=None ):
 		"""wraps newref into symbol and appends it to this rule's head."""
+		pool = Rule.pool
 		if isinstance( newref, Rule ):
-			newsymbol = Ruleref( newref )
+			newsymbol = pool.ruleref( newref ) if pool else Ruleref( newref )
 		else:
-			newsymbol = Symbol( newref )
+			newsymbol = pool.symbol( newref ) if pool else Symbol( newref )
 		#log.debug( "   appending symbol %s to %s" % (newsymbol.debugstr(), self.debugstr()) )
 		head = self.guard.l
 		head.insert( newsymbol, makeunique=makeunique )
@@ -421,7 +785,10 @@ class Rule( object ):
 		"""
 		# ensure rule utility
 		#log.debug( "   replacing digram at %s with reference to rule %s" % (digram.debugstr(), self.debugstr()) )
-		newsymbol = digram.replace_digram( Ruleref( self ) )
+		pool = Rule.pool
+		if Rule.store is not None: Rule.store.touch( self )
+		if Rule.listeners: Rule.notify( 'apply', self, digram )
+		newsymbol = digram.replace_digram( pool.ruleref( self ) if pool else Ruleref( self ) )
 		return newsymbol
 
 	def dissolve( self ):
@@ -431,6 +798,8 @@ class Rule( object ):
 		"""
 		#if len( self.refs ) != 1:
 		#	raise RuleError #TODO: nice message
+		if Rule.listeners: Rule.notify( 'dissolve', self )
+		if not self.refs: Rule.store.user( self ) # last reference is spilled
 		lastref = self.refs.copy().pop() # deleted via following symbol deletion trigger
 		#log.debug( "   dissolving rule %s into last reference %s" % (self.debugstr(), lastref.debugstr()) )
 		tail, head = lastref.replace()
@@ -444,6 +813,7 @@ class Rule( object ):
 		   returns False on full rule match, else the newly-formed rule.
 		"""
 		#log.debug( " makeunique with oldmatch %s and newmatch %s" % (oldmatch.debugstr(),newmatch.debugstr()) )
+		if cls.listeners: cls.notify( 'makeunique', oldmatch, newmatch )
 
 		if oldmatch.l.is_guard() and oldmatch.r.r.is_guard():
 			# full rule match, re-use existing rule
@@ -455,7 +825,7 @@ class Rule( object ):
 		else:
 			# create a new rule of the old digram
 			#log.debug( " makeunique creating new rule from %s and %s" % (oldmatch, oldmatch.r) )
-			newrule = Rule( oldmatch )
+			newrule = cls.pool.rule( oldmatch ) if cls.pool else Rule( oldmatch )
 			oldsymbol = newrule.apply( oldmatch ) # BUG: might go into learn/apply recursion
 			newsymbol = newrule.apply( newmatch )
 			return newrule
@@ -470,6 +840,94 @@ class Rule( object ):
 		#TODO: move marker to rule ID
 		return self.id
 
+class SymbolPool( object ):
+	"""Per-grammar free lists recycling deleted symbols, rule references and rules.
+	   a recycled rule keeps its guard and its (emptied) references set.
+	"""
+
+	kinds = ( 'Symbol', 'Ruleref', 'Rule', 'Guard' )
+
+	def __init__( self, maxfree=65536 ):
+		self.maxfree = maxfree
+		self.symbols = []
+		self.rulerefs = []
+		self.rulelist = []
+		self.allocated = dict( (k, 0) for k in self.kinds )
+		self.reused = dict( (k, 0) for k in self.kinds )
+		self.released = dict( (k, 0) for k in self.kinds )
+
+	def symbol( self, reference ):
+		"""returns a self-connected terminal symbol referencing reference."""
+		if self.symbols:
+			symbol = self.symbols.pop()
+			symbol.ref = reference
+			symbol.l = symbol
+			symbol.r = symbol
+			self.reused['Symbol'] += 1
+			return symbol
+		self.allocated['Symbol'] += 1
+		return Symbol( reference )
+
+	def ruleref( self, rule, ruleref=True ):
+		"""returns a self-connected symbol referencing rule.
+		   adds it to rule's references unless ruleref is False.
+		"""
+		if self.rulerefs:
+			symbol = self.rulerefs.pop()
+			symbol.ref = rule
+			symbol.l = symbol
+			symbol.r = symbol
+			if ruleref: rule.addref( symbol )
+			self.reused['Ruleref'] += 1
+			return symbol
+		self.allocated['Ruleref'] += 1
+		return Ruleref( rule, ruleref=ruleref )
+
+	def rule( self, digram=None ):
+		"""returns a registered rule made of digram's references."""
+		if self.rulelist:
+			rule = self.rulelist.pop()
+			self.reused['Rule'] += 1
+			self.reused['Guard'] += 1
+			rule.setup( digram )
+			return rule
+		self.allocated['Rule'] += 1
+		self.allocated['Guard'] += 1
+		return Rule( digram )
+
+	def release( self, obj ):
+		"""takes back a deleted symbol or rule.
+		   objects beyond maxfree are left to the garbage collector.
+		"""
+		if isinstance( obj, Rule ):
+			kind, free = 'Rule', self.rulelist
+			obj.refs.clear()
+			guard = obj.guard
+			guard.l = guard
+			guard.r = guard
+			self.released['Guard'] += 1
+			if len( free ) >= self.maxfree:
+				guard.ref = None # break rule<->guard cycle
+		else:
+			if isinstance( obj, Ruleref ):
+				kind, free = 'Ruleref', self.rulerefs
+			else:
+				kind, free = 'Symbol', self.symbols
+			obj.ref = None
+			obj.l = None
+			obj.r = None
+		self.released[kind] += 1
+		if len( free ) < self.maxfree: free.append( obj )
+
+	def stats( self ):
+		"""returns allocation, reuse and release counts per kind of object."""
+		return {
+			'allocated': dict( self.allocated ),
+			'reused': dict( self.reused ),
+			'released': dict( self.released ),
+			'free': { 'Symbol': len( self.symbols ), 'Ruleref': len( self.rulerefs ), 'Rule': len( self.rulelist ) },
+		}
+
 def print_state( index ):
 	"""dump Sequitur state in readable form"""
 	print "::::::::::::::::: Rules ::::::::::::::::::"
@@ -486,69 +944,460 @@ def print_state( index ):
 		s = index.dict[key]
 		print " ", repr(s), "  ", key
 
+def locked( method ):
+	"""runs a Sequitur method under Sequitur.lock, if one is set, with
+	   its grammar installed class-wide.
+	"""
+	install = method.__name__ not in ( '__init__', 'activate' )
+	@functools.wraps( method )
+	def wrapper( self, *args, **kw ):
+		lock = Sequitur.lock
+		if lock is None: return method( self, *args, **kw )
+		with lock:
+			if install: self.activate()
+			return method( self, *args, **kw )
+	return wrapper
+
+def grammarsize( s ):
+	"""returns number of symbols on the right-hand sides of all rules of s."""
+	return sum( len( rule.dump() ) for rule in s.rules.values() )
+
 class Sequitur( object ):
 
-	def __init__( self ):
-		Index.makeunique = Rule.makeunique
-		self.index = Index()
+	# grammar whose rule set and index are currently installed class-wide
+	active = None
+	# reentrant lock serializing grammars of several threads, see thread_sqt
+	lock = None
+
+	@locked
+	def __init__( self, index=None, store=None, decode=None ):
+		"""index is the digram index backend for this grammar, Index() by default.
+		   store optionally keeps cold rules out of memory, see spill_sqt.
+		   decode optionally maps terminals back to text on output,
+		   see token_sqt.
+		"""
+		active = Sequitur.active
+		if active is not None and active.rules is Rule.rules:
+			active.nextid = Rule.nextid
+			active.rulemarker = Rule.rulemarker
+		if index is None: index = Index()
+		index.makeunique = Rule.makeunique
+		self.index = index
 		Symbol.learn = self.index.learn
 		Symbol.forget = self.index.forget
+		self.pool = SymbolPool()
+		Symbol.pool = self.pool
+		Rule.pool = self.pool
+		self.store = store
+		Rule.store = store
+		self.listeners = []
+		Rule.listeners = self.listeners
+		self.decode = decode
+		# set for grammars not built by append(), see repair_sqt
+		self.readonly = False
 		Rule.reset()
-		self.S = Rule()
+		fpterminals.clear()
+		self.rules = Rule.rules
+		self.rulemarker = Rule.rulemarker
+		Sequitur.active = self
+		self.S = self.pool.rule()
+		if store is not None: store.attach( self )
+
+	@locked
+	def activate( self ):
+		"""installs this grammar's rule set and index callbacks class-wide.
+		   must be called before appending whenever several Sequitur
+		   objects take turns in the same process, unless Sequitur.lock
+		   is set: then append(), clear(), save() and restore() call it.
+		"""
+		active = Sequitur.active
+		if active is self: return
+		if active is not None and active.rules is Rule.rules:
+			active.nextid = Rule.nextid
+			active.rulemarker = Rule.rulemarker
+		Symbol.learn = self.index.learn
+		Symbol.forget = self.index.forget
+		Symbol.pool = self.pool
+		Rule.pool = self.pool
+		Rule.store = self.store
+		Rule.listeners = self.listeners
+		Rule.rules = self.rules
+		Rule.nextid = self.nextid
+		Rule.rulemarker = self.rulemarker
+		Sequitur.active = self
+
+	@locked
+	def clear( self ):
+		"""empties this grammar for reuse.
+		   breaks the symbol rings explicitly and hands symbols and rules
+		   back to the pool instead of leaving cycles to the garbage collector.
+		"""
+		self.activate()
+		if self.store is not None: self.store.reset()
+		pool = self.pool
+		for rule in self.rules.values():
+			symbol = rule.guard.r
+			while not symbol.is_guard():
+				right = symbol.r
+				pool.release( symbol )
+				symbol = right
+			pool.release( rule )
+		self.rules.clear()
+		self.index.reset()
+		self.readonly = False
+		fpterminals.clear()
+		Rule.nextid = 0
+		self.S = pool.rule()
+
+	def verify( self ):
+		"""checks the grammar in one linear pass over all rules:
+		   consistent l/r links, digram uniqueness, rule utility and
+		   refs matching the actual rule references.
+		   returns list of violations, empty if the grammar is sound.
+		"""
+		problems = []
+		digrams = {}
+		found = {}
+		for id in self.rules:
+			rule = self.rules[id]
+			guard = rule.guard
+			if rule.id != id or guard.ref is not rule:
+				problems.append( "%s: registered as %s with guard for %s" % (rule.debugstr(), id, repr(guard.ref)) )
+				continue
+			if rule.spilled: self.store.load( rule )
+			if rule is not self.S and rule.is_empty():
+				problems.append( "%s: empty rule" % rule.debugstr() )
+			symbol = guard
+			while True:
+				right = symbol.r
+				if right.l is not symbol:
+					problems.append( "%s: broken link between %s and %s" % (rule.debugstr(), symbol.debugstr(), right.debugstr()) )
+					break
+				if right is guard: break
+				if right.is_guard():
+					problems.append( "%s: foreign guard %s" % (rule.debugstr(), right.debugstr()) )
+					break
+				if right.is_ruleref():
+					found.setdefault( right.ref, [] ).append( right )
+				if symbol is not guard:
+					digram = (symbol.ref, right.ref)
+					seenat = digrams.get( digram )
+					if seenat is None:
+						digrams[digram] = symbol
+					elif seenat.r is not symbol: # overlapping digrams are fine
+						problems.append( "%s: digram %s repeated at %s and %s" % (rule.debugstr(), repr(digram), seenat.debugstr(), symbol.debugstr()) )
+				symbol = right
+		for rule, symbols in found.iteritems():
+			if self.rules.get( rule.id ) is not rule:
+				problems.append( "%s: referenced but not in rule set" % rule.debugstr() )
+				continue
+			if len( symbols ) < 2:
+				problems.append( "%s: referenced only %d times" % (rule.debugstr(), len( symbols )) )
+			if set( symbols ) != rule.refs:
+				problems.append( "%s: refs %d do not match %d references" % (rule.debugstr(), len( rule.refs ), len( symbols )) )
+		for id in self.rules:
+			rule = self.rules[id]
+			if rule is not self.S and rule not in found:
+				problems.append( "%s: unreferenced rule" % rule.debugstr() )
+		return problems
+
+	@locked
+	def save( self, f ):
+		"""writes this grammar to file object f, see load().
+		   besides the rules, the learning order of digrams that occur more
+		   than once in the index is kept, so a loaded grammar grows exactly
+		   like this one. terminals other than plain data must be of a class
+		   registered with terminalclass().
+		"""
+		self.activate()
+		duplicates = [digrams for digrams in self.index.duplicates()]
+		wanted = set( symbol for digrams in duplicates for symbol in digrams )
+		positions = {}
+		rules = []
+		for rule in self.rules.values():
+			rules.append( ( rule.num, rule.dump() ) )
+			if rule.spilled or not wanted: continue
+			pos = 0
+			for symbol in rule.eachsymbol():
+				if symbol in wanted: positions[symbol] = ( rule.num, pos )
+				pos += 1
+		order = []
+		for digrams in duplicates:
+			for symbol in digrams:
+				order.append( positions[symbol] )
+		state = {
+			'format': 'sqt-grammar',
+			'version': 1,
+			'rulemarker': Rule.rulemarker,
+			'nextid': Rule.nextid,
+			'S': self.S.num,
+			'rules': rules,
+			'order': order,
+			'readonly': self.readonly,
+		}
+		pickler = cPickle.Pickler( f, 2 )
+		pickler.persistent_id = lambda ref: ref.num if isinstance( ref, Rule ) else None
+		pickler.dump( state )
 
+	@classmethod
+	def load( cls, f, index=None, store=None, decode=None ):
+		"""returns new grammar read from file object f, see save()."""
+		s = cls( index=index, store=store, decode=decode )
+		s.restore( f )
+		return s
+
+	@locked
+	def restore( self, f ):
+		"""replaces this grammar's content by the grammar saved in file object f."""
+		self.clear()
+		pool = self.pool
+		rules = self.rules
+		del rules[self.S.id]
+		pool.release( self.S )
+		made = {}
+		def restored( num ):
+			rule = made.get( num )
+			if rule is None:
+				rule = made[num] = pool.rule()
+				del rules[rule.id]
+				rule.num = num
+				rule.id = str(Rule.rulemarker) + str(num)
+			return rule
+		unpickler = cPickle.Unpickler( f )
+		unpickler.persistent_load = restored
+		unpickler.find_global = findclass
+		try:
+			state = unpickler.load()
+		except ( ValueError, KeyError, IndexError, TypeError, AttributeError ) as e:
+			raise cPickle.UnpicklingError( "garbled grammar: %s" % repr(e) )
+		if not isinstance( state, dict ) or state.get( 'format' ) != 'sqt-grammar':
+			raise RuleError( "not a saved Sequitur grammar" )
+		try:
+			self.rebuild( state, restored, made )
+		except ( ValueError, KeyError, IndexError, TypeError, AttributeError ) as e:
+			raise RuleError( "inconsistent saved grammar: %s" % repr(e) )
+
+	def rebuild( self, state, restored, made ):
+		"""fills this grammar from unpickled state.
+		   restored( num ) returns the rule saved as num, made maps the
+		   numbers to the rules restored so far.
+		"""
+		pool = self.pool
+		rules = self.rules
+		self.rulemarker = Rule.rulemarker = str( state['rulemarker'] )
+		for rule in made.itervalues():
+			rule.id = self.rulemarker + str( rule.num )
+		symbols = {}
+		for num, refs in state['rules']:
+			rule = restored( num )
+			head = rule.guard
+			ring = symbols[num] = []
+			for ref in refs:
+				if isinstance( ref, Rule ):
+					symbol = pool.ruleref( ref )
+				else:
+					symbol = pool.symbol( ref )
+				head.insert( symbol, learn=False )
+				head = symbol
+				ring.append( symbol )
+		self.S = made[state['S']]
+		for rule in made.itervalues():
+			rules[rule.id] = rule
+		Rule.nextid = state['nextid']
+		self.readonly = bool( state.get( 'readonly' ) )
+		# index digrams, keeping the saved order of repeated ones
+		order = [ symbols[num][pos] for num, pos in state['order'] ]
+		ordered = set( order )
+		index = self.index
+		for ring in symbols.itervalues():
+			for symbol in ring[:-1]:
+				if symbol not in ordered: index.add( symbol )
+		for symbol in order:
+			index.add( symbol )
+
+	def memory_report( self, deep=False ):
+		"""returns bytes and object counts per grammar component.
+		   by default counts come from the pool's allocation counters and
+		   the index's running counts, per-object sizes are sampled once per
+		   kind, so the report takes constant time. deep sizes every object
+		   of the grammar individually instead.
+		   'refs' and 'index' count references to symbols, not objects of
+		   their own, so the 'total' count covers symbols, guards, rules
+		   and the pool only.
+		"""
+		def sizeof( obj ):
+			size = sys.getsizeof( obj )
+			if hasattr( obj, '__dict__' ): size += sys.getsizeof( obj.__dict__ )
+			return size
+		report = {}
+		def add( component, count, size ):
+			report[component] = { 'count': count, 'bytes': size }
+		pool = self.pool
+		if deep:
+			rules = self.rules.values()
+			add( 'refs', sum( len( rule.refs ) for rule in rules ), sum( sys.getsizeof( rule.refs ) for rule in rules ) )
+			add( 'rules', len( rules ), sys.getsizeof( self.rules ) + sum( sizeof( rule ) for rule in rules ) )
+			count = { 'Symbol': 0, 'Ruleref': 0, 'Guard': 0 }
+			size = { 'Symbol': 0, 'Ruleref': 0, 'Guard': 0 }
+			for rule in rules:
+				count['Guard'] += 1
+				size['Guard'] += sizeof( rule.guard )
+				symbol = rule.guard.r
+				while not symbol.is_guard():
+					kind = 'Ruleref' if symbol.is_ruleref() else 'Symbol'
+					count[kind] += 1
+					size[kind] += sizeof( symbol )
+					symbol = symbol.r
+			for kind in count:
+				add( kind, count[kind], size[kind] )
+			free = pool.symbols + pool.rulerefs
+			add( 'pool', len( free ) + len( pool.rulelist ),
+				sum( sizeof( x ) for x in free ) + sum( sizeof( r ) + sizeof( r.guard ) for r in pool.rulelist ) )
+		else:
+			live = lambda kind: pool.allocated[kind] + pool.reused[kind] - pool.released[kind]
+			# refs sets of up to five references, larger ones are undersized
+			add( 'refs', live( 'Ruleref' ), live( 'Rule' ) * sys.getsizeof( set() ) )
+			add( 'rules', live( 'Rule' ), sys.getsizeof( self.rules ) + live( 'Rule' ) * sizeof( self.S ) )
+			sample = { 'Symbol': sizeof( Symbol( None ) ), 'Ruleref': sizeof( Ruleref( self.S, ruleref=False ) ), 'Guard': sizeof( self.S.guard ) }
+			for kind in sample:
+				add( kind, live( kind ), live( kind ) * sample[kind] )
+			add( 'pool', len( pool.symbols ) + len( pool.rulerefs ) + len( pool.rulelist ),
+				len( pool.symbols ) * sample['Symbol'] + len( pool.rulerefs ) * sample['Ruleref']
+				+ len( pool.rulelist ) * ( sizeof( self.S ) + sample['Guard'] ) )
+		add( 'index', len( self.index ), self.index.sizeof( deep ) )
+		if self.store is not None:
+			add( 'spilled', len( self.store.spilledrules ), self.store.sizeof() )
+		objects = ( 'Symbol', 'Ruleref', 'Guard', 'rules', 'pool' )
+		report['total'] = { 'count': sum( report[c]['count'] for c in objects ),
+			'bytes': sum( c['bytes'] for c in report.values() ) }
+		return report
+
+	def subscribe( self, listener ):
+		"""registers listener( event, *args ) for this grammar's events:
+		   'append' (symbol), 'makeunique' (oldmatch, newmatch),
+		   'rule' (rule), 'apply' (rule, digram), 'dissolve' (rule)
+		   and 'delete' (rule).
+		"""
+		self.listeners.append( listener )
+
+	def unsubscribe( self, listener ):
+		"""removes listener registered with subscribe()."""
+		self.listeners.remove( listener )
+
+	@locked
 	def append( self, symbol ):
-		"""append symbol to main rule S."""
+		"""append symbol to main rule S.
+		   raises RuleError if the grammar is read-only.
+		"""
+		if self.readonly:
+			raise RuleError( "cannot append to read-only grammar" )
+		for listener in self.listeners:
+			listener( 'append', symbol )
 		self.S.append( symbol )
+		if self.store is not None: self.store.maintain()
 
 	def walk( self ):
 		"""iterate over main rule S and recursively yield
 		   the sequence of appended symbols.
 		"""
-		for x in self.S.walk(): yield x
+		decode = self.decode
+		if decode is None:
+			for x in self.S.walk(): yield x
+		else:
+			for x in self.S.walk(): yield decode( x )
 
 	def spell_rules( self ):
 		"""pretty-print all rules. great for character-based input."""
+		decode = self.decode or str
 		a = []
-		for i in Rule.rules:
-			r = Rule.rules[i]
+		for i in self.rules:
+			r = self.rules[i]
 			s = str(r)+": "
-			s += ''.join( r.walk() )
+			s += ''.join( decode( x ) for x in r.walk() )
 			a.append( s )
 		return '\n'.join( a )
 
 	def __str__( self ):
 		"""returns string-representation of the rule set."""
+		decode = self.decode or str
 		a = []
-		for i in Rule.rules:
-			r = Rule.rules[i]
+		for i in self.rules:
+			r = self.rules[i]
 			s = str(r)+": "
 			b = []
 			for d in r.each():
 				if isinstance( d, Rule ):
 					b.append(str(d))
 				else:
-					b.append(repr(str(d)))
+					b.append(repr(decode(d)))
 			s += ' '.join( b )
 			a.append( s )
 		return '\n'.join( a )
 
 def main():
+	import token_sqt
 	log.basicConfig( level=log.WARNING )
-	try:
-		filename = sys.argv[1]
-	except:
-		log.fatal( "no filename argument given" )
-		sys.exit(5)
-
-	with open( filename ) as f:
-		data = bytearray( f.read() )
-
-	s = Sequitur()
-	for byte in data:
-		s.append( chr(byte) )
+	parser = argparse.ArgumentParser( description="build a Sequitur grammar of a file" )
+	parser.add_argument( 'filename' )
+	parser.add_argument( '--memory-report', metavar='FILE',
+		help="write JSON memory report to FILE, - for stdout" )
+	parser.add_argument( '--deep', action='store_true',
+		help="size every object for the memory report" )
+	parser.add_argument( '--cache', metavar='DIR',
+		help="load or resume the grammar from the grammar cache in DIR" )
+	parser.add_argument( '--tokens', metavar='SPLITTER', choices=sorted( token_sqt.splitters ),
+		help="feed tokens instead of characters: %s, see token_sqt" % ', '.join( sorted( token_sqt.splitters ) ) )
+	parser.add_argument( '--runs', metavar='MINRUN', type=int,
+		help="feed runs of at least MINRUN equal characters as one terminal, see run_sqt" )
+	parser.add_argument( '--export', metavar='FILE',
+		help="stream the grammar to FILE as JSON Lines, DOT or CSV by its extension" )
+	parser.add_argument( '-n', '--no-shell', action='store_true',
+		help="do not print the grammar and drop into ipython" )
+	args = parser.parse_args()
+	if len( [x for x in ( args.tokens, args.cache, args.runs ) if x is not None] ) > 1:
+		parser.error( "--tokens, --cache and --runs cannot be combined" )
+	if args.runs is not None and args.runs < 2:
+		parser.error( "--runs MINRUN must be at least 2" )
+
+	with open( args.filename ) as f:
+		data = f.read()
+
+	if args.tokens:
+		s = token_sqt.build( [data], splitter=args.tokens )
+	elif args.runs is not None:
+		import run_sqt
+		s = run_sqt.build( data, minrun=args.runs )
+	elif args.cache:
+		from cache_sqt import GrammarCache
+		s, how = GrammarCache( args.cache ).build( data )
+		log.info( "grammar cache %s" % how )
+	else:
+		s = Sequitur()
+		for byte in bytearray( data ):
+			s.append( chr(byte) )
+
+	if args.export:
+		import export_sqt
+		format = args.export.rsplit( '.', 1 )[-1].lower()
+		if format not in export_sqt.writers:
+			parser.error( "--export FILE must end in .%s" % ', .'.join( sorted( export_sqt.writers ) ) )
+		with open( args.export, 'wb' ) as f:
+			export_sqt.export( s, f, format )
+
+	if args.memory_report:
+		report = json.dumps( s.memory_report( deep=args.deep ), indent=1, sort_keys=True )
+		if args.memory_report == '-':
+			print report
+		else:
+			with open( args.memory_report, 'w' ) as f:
+				f.write( report + '\n' )
 
-	print s
-	embed()
+	if not args.no_shell:
+		print s
+		embed()
 
 if __name__ == '__main__':
-	main()
+	# run as the sqt module, so grammars built here and by the helper
+	# modules main() imports share the same classes
+	import sqt
+	sqt.main()
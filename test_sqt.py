@@ -1,7 +1,32 @@
 #!/usr/bin/env python
 
 from sqt import *
+from async_sqt import Feeder, Dispatcher, loop
+from thread_sqt import ThreadedSequitur, IngestError, buildlock
+from spill_sqt import SpillStore
+import trace_sqt
+from cache_sqt import GrammarCache
+import ncd_sqt
+import token_sqt
+from replica_sqt import DeltaLog, Replay, ReplicationError
+import multiprocessing
+import repair_sqt
+import run_sqt
+from rulestore_sqt import RuleStore
+import export_sqt
+import estimate_sqt
+import expand_sqt
+import json
+import csv
+import cStringIO
+import cPickle
+import tempfile
+import time
+import shutil
+import os
+import threading
 import random
+import socket
 import unittest
 import logging as log
 log.basicConfig( level=log.WARNING )
@@ -400,6 +425,102 @@ class Test_CA_Index( unittest.TestCase ):
 		#r.append( 4 )
 		#self.assertEqual( r.walk(), [1, 2, 3, 4, 2, 3, 1, 2, 3, 4] )
 
+#########################################################################################
+class Test_CB_ArrayIndex( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		Rule.reset()
+		log.info( " ##### END %s ##############" % cls )
+
+	def setUp( self ):
+		self.index = ArrayIndex( capacity=4 )
+		Rule.reset()
+
+	def test_arrayindex_learning( self ):
+		unlearned = Symbol( 1 )
+		unlearned.insert( Symbol( 2 ) )
+		self.assertFalse( self.index.seen( unlearned ) )
+		digrams = []
+		for i in xrange( 20 ): # forces resizing
+			a = Symbol( i )
+			a.insert( Symbol( 2 ) )
+			self.index.learn( a )
+			digrams.append( a )
+		self.assertEqual( len( self.index ), 20 )
+		self.assertIs( self.index.seen( unlearned ), digrams[1] )
+		self.assertTrue( self.index.forget( digrams[1] ) )
+		self.assertFalse( self.index.seen( unlearned ) )
+		with self.assertRaises( ValueError ): self.index.forget( digrams[1] ) # as Index
+		self.assertEqual( len( self.index ), 19 )
+		big = Symbol( Rule() )
+		big.ref.num = ArrayIndex.MAXCODE
+		big.insert( Symbol( 2 ) )
+		with self.assertRaises( OverflowError ): self.index.add( big )
+
+	def test_arrayindex_first_learned( self ):
+		global cb
+		a = Symbol( 1 )
+		b = Symbol( 1 )
+		c = Symbol( 1 )
+		d = Symbol( 1 )
+		a.insert( b )
+		b.insert( c )
+		c.insert( d )
+		cb = []
+		self.index.learn( a, makeunique=callback )
+		self.index.learn( b, makeunique=callback )
+		self.assertEqual( len(cb), 0 )
+		self.index.forget( a )
+		self.index.learn( a, makeunique=callback ) # behind b, not in a's tombstone
+		self.assertEqual( len(cb), 0 )
+		self.assertIs( self.index.seen( c ), b )
+
+	def test_arrayindex_order( self ):
+		rnd = random.Random( 31 )
+		index = Index()
+		learned = []
+		for step in xrange( 3000 ): # many tombstones, resizes and wrapped clusters
+			if learned and rnd.random() < 0.45:
+				digram = learned.pop( rnd.randrange( len( learned ) ) )
+				self.index.forget( digram )
+				index.forget( digram )
+			else:
+				digram = Symbol( rnd.randint( 0, 15 ) )
+				digram.insert( Symbol( rnd.randint( 0, 3 ) ) )
+				self.index.add( digram )
+				index.add( digram )
+				learned.append( digram )
+			probe = learned[rnd.randrange( len( learned ) )] if learned else digram
+			self.assertIs( self.index.seen( probe ), index.seen( probe ) )
+		self.assertEqual( len( self.index ), len( index ) )
+
+	def test_arrayindex_rule_codes( self ):
+		r = Rule()
+		a = Symbol( r )
+		a.insert( Symbol( 'x' ) )
+		b = Symbol( 'r0' )
+		b.insert( Symbol( 'x' ) )
+		self.index.learn( a )
+		self.assertFalse( self.index.seen( b ) )
+
+	def test_arrayindex_sequitur( self ):
+		data = list( "abcdbcabcd" )
+		s = Sequitur( index=ArrayIndex() )
+		for x in data: s.append( x )
+		S = Rule.rules['r0']
+		A = Rule.rules['r1']
+		C = Rule.rules['r3']
+		self.assertEqual( S.dump(), [C,A,C] )
+		self.assertEqual( C.dump(), ['a',A,'d'] )
+		self.assertEqual( s.verify(), [] )
+
+
 #########################################################################################
 class Test_DA_Sequitur( unittest.TestCase ):
 
@@ -495,6 +616,918 @@ class Test_DA_Sequitur( unittest.TestCase ):
 			for c in rnd: s.append( c )
 			self.assertEqual( [x for x in s.walk()], rnd )
 
+	def test_sequitur_activate( self ):
+		a = Sequitur()
+		b = Sequitur()
+		x = list( "abcabdabcabd" )
+		y = list( "xyzzyxyzzy" )
+		for i in xrange( max( len(x), len(y) ) ):
+			if i < len(x):
+				a.activate()
+				a.append( x[i] )
+			if i < len(y):
+				b.activate()
+				b.append( y[i] )
+		self.assertEqual( [c for c in a.walk()], x )
+		self.assertEqual( [c for c in b.walk()], y )
+		c = Sequitur()
+		for ch in x: c.append( ch )
+		self.assertEqual( str(a), str(c) )
+
+	def test_sequitur_pool( self ):
+		data = list( "abcabdabcabdxabcabdabcabdy" * 8 )
+		for x in data: self.s.append( x )
+		self.assertEqual( [x for x in self.s.walk()], data )
+		stats = self.s.pool.stats()
+		live = lambda k: stats['allocated'][k] + stats['reused'][k] - stats['released'][k]
+		self.assertTrue( stats['reused']['Symbol'] > 0 )
+		self.assertTrue( stats['reused']['Ruleref'] > 0 )
+		symbols = sum( len( r.dump() ) for r in self.s.rules.values() )
+		self.assertEqual( live('Symbol') + live('Ruleref'), symbols )
+		self.assertEqual( live('Rule'), len( self.s.rules ) )
+		self.assertTrue( stats['allocated']['Symbol'] + stats['allocated']['Ruleref'] < len( data ) )
+
+	def test_sequitur_pool_ownership( self ):
+		# Symbol.pool is class-wide: taking turns must hand every deleted
+		# symbol and rule back to the pool of the grammar it belonged to
+		grammars = [ Sequitur(), Sequitur() ]
+		data = [ list( "abcabdabcabdxabcabdabcabdy" * 4 ), list( "xyzzyxyzzyaaaabaaaaaa" * 4 ) ]
+		for i in xrange( max( len( d ) for d in data ) ):
+			for s, d in zip( grammars, data ):
+				if i < len( d ):
+					s.activate()
+					s.append( d[i] )
+		owned = []
+		for s, d in zip( grammars, data ):
+			self.assertEqual( [x for x in s.walk()], d )
+			stats = s.pool.stats()
+			live = lambda k: stats['allocated'][k] + stats['reused'][k] - stats['released'][k]
+			self.assertTrue( stats['released']['Symbol'] > 0 and stats['released']['Rule'] > 0 )
+			self.assertEqual( live('Symbol') + live('Ruleref'), sum( len( r.dump() ) for r in s.rules.values() ) )
+			self.assertEqual( live('Rule'), len( s.rules ) )
+			symbols = set( x for r in s.rules.values() for x in r.eachsymbol() )
+			free = set( s.pool.symbols + s.pool.rulerefs )
+			self.assertFalse( symbols & free )
+			owned.append( symbols | free | set( s.pool.rulelist ) | set( s.rules.values() ) )
+		self.assertFalse( owned[0] & owned[1] )
+
+	def test_sequitur_clear( self ):
+		data = list( "abcdbcabcd" )
+		for x in list( "xyzxyzxyzaaaa" ): self.s.append( x )
+		rules = self.s.rules
+		released = self.s.pool.stats()['released']['Symbol']
+		self.s.clear()
+		self.assertIs( self.s.rules, rules )
+		self.assertEqual( len( self.s.rules ), 1 )
+		self.assertEqual( len( self.s.index ), 0 )
+		self.assertTrue( self.s.pool.stats()['released']['Symbol'] > released )
+		for x in data: self.s.append( x )
+		fresh = Sequitur()
+		for x in data: fresh.append( x )
+		self.assertEqual( [x for x in self.s.walk()], data )
+		self.assertEqual( self.s.verify(), [] )
+		shape = lambda s: sorted( str( s ).split( '\n' ) )
+		self.assertEqual( shape( self.s ), shape( fresh ) )
+
+	def test_sequitur_verify( self ):
+		for x in list( "abcdbcabcdaaaabaaaaaa" ): self.s.append( x )
+		self.assertEqual( self.s.verify(), [] )
+		A = Rule.rules['r1']
+		victim = A.refs.pop()
+		self.assertEqual( len( self.s.verify() ), 1 )
+		A.refs.add( victim )
+		self.s.S.append( 'x', makeunique=False )
+		self.s.S.append( 'y', makeunique=False )
+		self.s.S.append( 'x', makeunique=False )
+		self.s.S.append( 'y', makeunique=False )
+		problems = self.s.verify()
+		self.assertEqual( len( problems ), 1 )
+		self.assertTrue( "repeated" in problems[0] )
+
+	def test_sequitur_verify_links( self ):
+		for x in list( "abcdbcabcd" ): self.s.append( x )
+		A = Rule.rules['r1']
+		A.guard.r.r.l = A.guard
+		self.assertTrue( "broken link" in self.s.verify()[0] )
+
+	def test_sequitur_events( self ):
+		events = []
+		self.s.subscribe( lambda event, *args: events.append( (event, args) ) )
+		for x in list( "abcdbc" ): self.s.append( x )
+		self.assertEqual( [e for e,a in events], ['append']*6 + ['makeunique','rule','apply','apply'] )
+		self.assertIs( events[-2][1][0], Rule.rules['r1'] )
+		del events[:]
+		for x in list( "abcd" ): self.s.append( x )
+		kinds = [e for e,a in events]
+		self.assertEqual( kinds.count( 'dissolve' ), 1 )
+		self.assertEqual( kinds.count( 'delete' ), 1 )
+		self.assertIs( events[kinds.index( 'delete' )][1][0], events[kinds.index( 'dissolve' )][1][0] )
+
+	def test_sequitur_memory_report( self ):
+		data = list( "abcdbcabcdaaaabaaaaaa" * 20 )
+		for x in data: self.s.append( x )
+		report = self.s.memory_report()
+		deep = self.s.memory_report( deep=True )
+		for component in ( 'Symbol', 'Ruleref', 'Guard', 'refs', 'rules', 'index', 'pool', 'total' ):
+			self.assertEqual( report[component]['count'], deep[component]['count'] )
+			self.assertTrue( report[component]['bytes'] >= 0 )
+		self.assertEqual( report['Guard']['count'], len( self.s.rules ) )
+		self.assertEqual( report['Symbol']['count'] + report['Ruleref']['count'],
+			sum( len( r.dump() ) for r in self.s.rules.values() ) )
+		self.assertEqual( report['Ruleref']['bytes'], deep['Ruleref']['bytes'] )
+		self.assertEqual( report['total']['bytes'], sum( v['bytes'] for k,v in report.items() if k != 'total' ) )
+		self.assertEqual( report['total']['count'], sum( report[k]['count'] for k in ( 'Symbol', 'Ruleref', 'Guard', 'rules', 'pool' ) ) )
+		self.assertEqual( report['index']['count'], sum( len( d ) for d in self.s.index.dict.itervalues() ) )
+		self.assertTrue( abs( report['index']['bytes'] - deep['index']['bytes'] ) * 10 < deep['index']['bytes'] )
+
+	def test_sequitur_fingerprint( self ):
+		def fold( seq ):
+			fp = (0,0)
+			for x in seq: fp = fpconcat( fp, fingerprint( x ) )
+			return fp
+		data = list( "abcdbcabcdaaaabaaaaaa" * 20 )
+		for x in data: self.s.append( x )
+		self.assertTrue( all( rule.fp is None for rule in self.s.rules.values() ) ) # computed on first use
+		for rule in self.s.rules.values():
+			self.assertEqual( rule.fingerprint(), fold( rule.walk() ) )
+		self.assertEqual( self.s.S.fingerprint()[1], len( data ) )
+		other = Sequitur()
+		for x in "xyz" + "abcdbcabcd" * 3: other.append( x )
+		fps = set( rule.fingerprint() for rule in self.s.rules.values() )
+		self.assertTrue( any( rule.fingerprint() in fps for rule in other.rules.values() if rule is not other.S ) )
+		self.assertNotEqual( fingerprint( 'a' ), fingerprint( 'b' ) )
+		self.assertTrue( fpterminals )
+		self.s.clear()
+		self.assertEqual( fpterminals, {} )
+
+	def test_sequitur_save_load( self ):
+		data = list( "abcdbcabcdaaaabaaaaaa" * 20 )
+		for index in ( Index, ArrayIndex ):
+			s = Sequitur( index=index() )
+			for x in data[:203]: s.append( x )
+			f = cStringIO.StringIO()
+			s.save( f )
+			loaded = Sequitur.load( cStringIO.StringIO( f.getvalue() ), index=index() )
+			self.assertEqual( sorted( str(loaded).split('\n') ), sorted( str(s).split('\n') ) )
+			self.assertEqual( loaded.verify(), [] )
+			for x in data[203:]: loaded.append( x )
+			full = Sequitur( index=index() )
+			for x in data: full.append( x )
+			self.assertEqual( sorted( str(loaded).split('\n') ), sorted( str(full).split('\n') ) )
+			self.assertEqual( [x for x in loaded.walk()], data )
+		with self.assertRaises( RuleError ):
+			f = cStringIO.StringIO()
+			cPickle.dump( {}, f, 2 )
+			self.s.restore( cStringIO.StringIO( f.getvalue() ) )
+		with self.assertRaises( RuleError ):
+			f = cStringIO.StringIO()
+			cPickle.dump( {'format': 'sqt-grammar', 'rulemarker': 'r', 'rules': [(0, 'ab')], 'S': 7}, f, 2 )
+			self.s.restore( cStringIO.StringIO( f.getvalue() ) )
+		with self.assertRaises( cPickle.UnpicklingError ):
+			self.s.restore( cStringIO.StringIO( cPickle.dumps( {'format': os.getcwd}, 2 ) ) )
+
+	def test_sequitur_save_rulemarker( self ):
+		Rule.rulemarker = 'q'
+		for x in "abcdbcabcd": self.s.append( x )
+		f = cStringIO.StringIO()
+		self.s.save( f )
+		other = Sequitur()
+		self.assertEqual( Rule.rulemarker, 'r' )
+		loaded = Sequitur.load( cStringIO.StringIO( f.getvalue() ) )
+		self.assertEqual( sorted( loaded.rules ), ['q0', 'q1', 'q3'] )
+		loaded.append( 'b' )
+		loaded.append( 'c' )
+		self.assertTrue( all( id.startswith( 'q' ) for id in loaded.rules ) )
+		other.activate()
+		self.assertEqual( Rule.rulemarker, 'r' )
+		self.assertEqual( loaded.verify(), [] )
+
+
+#########################################################################################
+class Test_EA_Async( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_feeder_slices( self ):
+		f = Feeder( slicesize=4, highwater=8 )
+		self.assertTrue( f.feed( "abcab" ) )
+		self.assertFalse( f.feed( "cabc" ) ) # backpressure
+		self.assertTrue( f.paused() )
+		self.assertEqual( f.step(), 4 )
+		self.assertEqual( f.backlog(), 5 )
+		self.assertFalse( f.paused() )
+		self.assertEqual( f.drain(), 5 )
+		self.assertEqual( ''.join( f.s.walk() ), "abcabcabc" )
+
+	def test_dispatcher_socketpair( self ):
+		data = [ "abcdbcabcd"*50, "aabbaabbaaab"*40 ]
+		dispatchers = []
+		map = {}
+		for d in data:
+			src, dst = socket.socketpair()
+			src.sendall( d )
+			src.close()
+			dispatchers.append( Dispatcher( dst, Feeder( slicesize=16, highwater=64 ), bufsize=32, map=map ) )
+		loop( dispatchers, timeout=0.01, map=map )
+		for d, disp in zip( data, dispatchers ):
+			self.assertEqual( ''.join( disp.feeder.s.walk() ), d )
+			self.assertEqual( disp.feeder.processed, len(d) )
+
+	def test_dispatcher_backpressure( self ):
+		src, dst = socket.socketpair()
+		disp = Dispatcher( dst, Feeder( highwater=4 ), map={} )
+		self.assertTrue( disp.readable() )
+		disp.feeder.feed( "abcd" )
+		self.assertFalse( disp.readable() )
+		disp.feeder.step()
+		self.assertTrue( disp.readable() )
+		src.close()
+		disp.close()
+
+
+#########################################################################################
+class Test_EB_Threaded( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_threaded_producers( self ):
+		t = ThreadedSequitur( maxsize=4, batchsize=3 )
+		def produce( ch ):
+			for i in xrange( 50 ):
+				t.put( ch * ( i % 5 + 1 ) + "xy" )
+		threads = [threading.Thread( target=produce, args=(ch,) ) for ch in "abcd"]
+		for th in threads: th.start()
+		for th in threads: th.join()
+		t.flush()
+		self.assertEqual( t.depth(), 0 )
+		s = t.close()
+		out = ''.join( s.walk() )
+		for ch in "abcd":
+			self.assertEqual( out.count( ch ), 50 * 3 )
+		self.assertEqual( out.count( "xy" ), 200 )
+		stats = t.stats()
+		self.assertEqual( stats['chunks'], 200 )
+		self.assertEqual( stats['bytes'], len( out ) )
+		self.assertTrue( 0 < stats['maxdepth'] <= 4 )
+
+	def test_threaded_close( self ):
+		t = ThreadedSequitur()
+		t.put( "abcabc" )
+		s = t.close()
+		self.assertEqual( ''.join( s.walk() ), "abcabc" )
+		with self.assertRaises( IngestError ): t.put( "abc" )
+
+	def test_threaded_close_race( self ):
+		for round in xrange( 20 ):
+			t = ThreadedSequitur( maxsize=2, batchsize=2 )
+			put = []
+			def produce( ch ):
+				try:
+					while True:
+						t.put( ch )
+						put.append( ch )
+				except IngestError:
+					pass
+			threads = [threading.Thread( target=produce, args=(ch,) ) for ch in "abc"]
+			for th in threads: th.start()
+			time.sleep( 0.001 )
+			s = t.close() # must not leave a chunk behind the sentinel
+			for th in threads: th.join()
+			t.flush()
+			self.assertEqual( sorted( s.walk() ), sorted( put ) )
+			self.assertEqual( t.stats()['chunks'], len( put ) )
+
+	def test_threaded_concurrent_grammars( self ):
+		data = "abcdbcabcdaaaabaaaaaa" * 1000
+		t1 = ThreadedSequitur( maxsize=8, batchsize=4 )
+		def produce():
+			for i in xrange( 0, len( data ), 50 ):
+				t1.put( data[i:i+50] )
+		producer = threading.Thread( target=produce )
+		producer.start()
+		others = []
+		while producer.is_alive():
+			others.append( ThreadedSequitur() )
+			s = Sequitur() # takes the lock and activates by itself
+			for x in "abcabc": s.append( x )
+			with buildlock:
+				self.assertEqual( ''.join( s.walk() ), "abcabc" )
+				self.assertEqual( s.verify(), [] )
+		producer.join()
+		s = t1.close()
+		self.assertEqual( ''.join( s.walk() ), data )
+		self.assertEqual( s.verify(), [] )
+		self.assertTrue( others )
+		for t in others:
+			self.assertEqual( ''.join( t.close().walk() ), "" )
+
+
+#########################################################################################
+class Test_EC_Spill( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def build( self, data, **kw ):
+		s = Sequitur( **kw )
+		for x in data: s.append( x )
+		return s
+
+	def test_spill_roundtrip( self ):
+		data = list( "the cat sat on the mat, the cat sat on the hat. " * 6 )
+		plain = str( self.build( data ) )
+		for index in ( Index, ArrayIndex ):
+			store = SpillStore( resident=2 )
+			s = self.build( data, index=index(), store=store )
+			stats = store.stats()
+			self.assertTrue( stats['spills'] > 0 )
+			self.assertTrue( stats['misses'] > 0 )
+			self.assertTrue( stats['spilled'] > 0 )
+			self.assertEqual( [x for x in s.walk()], data )
+			self.assertEqual( str( s ), plain ) # read-through, no faults
+			self.assertEqual( store.stats()['misses'], stats['misses'] )
+			self.assertEqual( s.verify(), [] ) # faults everything in
+			self.assertEqual( store.stats()['spilled'], 0 )
+
+	def test_spill_refs( self ):
+		store = SpillStore( resident=0 )
+		s = self.build( list( "abcdbcabcd" ), store=store )
+		C = Rule.rules['r3']
+		A = Rule.rules['r1']
+		self.assertTrue( C.spilled and A.spilled )
+		self.assertEqual( C.dump(), ['a',A,'d'] )
+		self.assertEqual( ( len( A.refs ), A.spilledrefs, A.refcount() ), ( 1, 1, 2 ) ) # in S and spilled C
+		self.assertTrue( C.guard.r.is_guard() )
+		self.assertEqual( len( s.index ), 2 ) # only the digrams of S
+		self.assertEqual( [x.ref for x in C.eachsymbol()], ['a',A,'d'] ) # faults in
+		self.assertFalse( C.spilled )
+		self.assertTrue( C in store.lru )
+		self.assertEqual( ( len( A.refs ), A.spilledrefs ), ( 2, 0 ) )
+		self.assertEqual( len( s.index ), 4 )
+		for x in "abcd": s.append( x ) # finds spilled digrams, dissolves through spilled refs
+		self.assertEqual( ''.join( s.walk() ), "abcdbcabcdabcd" )
+		self.assertEqual( s.verify(), [] )
+
+	def test_spill_bounded( self ):
+		rnd = random.Random( 1 )
+		words = [ ''.join( rnd.choice( "abcdefgh" ) for j in xrange( rnd.randint( 2, 6 ) ) ) for i in xrange( 200 ) ]
+		data = list( ' '.join( rnd.choice( words ) for i in xrange( 2000 ) ) )
+		plain = self.build( data )
+		store = SpillStore( resident=8 )
+		s = self.build( data, store=store )
+		resident = [ rule for rule in s.rules.values() if not rule.spilled ]
+		self.assertTrue( len( resident ) <= store.resident + 1 )
+		self.assertTrue( store.stats()['spilled'] > 10 * store.resident )
+		symbols = sum( len( rule.dump() ) for rule in resident )
+		stats = s.pool.stats()
+		live = lambda k: stats['allocated'][k] + stats['reused'][k] - stats['released'][k]
+		self.assertEqual( live( 'Symbol' ) + live( 'Ruleref' ), symbols )
+		self.assertEqual( len( s.index ), symbols - len( resident ) )
+		outside = lambda g: len( g.index ) - len( g.S.dump() ) + 1 # index entries not in S
+		self.assertTrue( outside( s ) * 10 < outside( plain ) )
+		self.assertEqual( sorted( str( s ).split( '\n' ) ), sorted( str( plain ).split( '\n' ) ) )
+		self.assertEqual( s.verify(), [] )
+
+#########################################################################################
+class Test_ED_Trace( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_trace_replay( self ):
+		data = list( "abcdbcabcdaaaabaaaaaa" * 60 )
+		f = cStringIO.StringIO()
+		trace_sqt.record( data, f )
+		records = list( trace_sqt.read( cStringIO.StringIO( f.getvalue() ) ) )
+		self.assertEqual( [r[0] for r in records], data )
+		self.assertEqual( records[5], ('c', 'MAA', (-1,1,1)) )
+		for index in ( Index, ArrayIndex ):
+			report = trace_sqt.replay( cStringIO.StringIO( f.getvalue() ), index=index() )
+			self.assertIs( report['divergence'], None )
+			self.assertTrue( report['walk_ok'] )
+			self.assertEqual( report['symbols'], len( data ) )
+			self.assertTrue( report['events']['dissolve'] > 0 )
+			self.assertEqual( sorted( report['timing'] ), ['build','diff','read','walk'] )
+
+	def test_trace_divergence( self ):
+		f = cStringIO.StringIO()
+		recorder = trace_sqt.TraceRecorder( f )
+		rule = Sequitur().S
+		for symbol, events in [ ('a',''), ('b',''), ('a',''), ('b','A') ]:
+			recorder( 'append', symbol )
+			for e in events:
+				recorder( trace_sqt.names[e], rule )
+		recorder.close()
+		report = trace_sqt.replay( cStringIO.StringIO( f.getvalue() ) )
+		self.assertEqual( report['divergence']['position'], 3 )
+		self.assertEqual( report['divergence']['replayed'], 'MAA' )
+
+
+#########################################################################################
+class Test_EE_Cache( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def setUp( self ):
+		self.path = tempfile.mkdtemp()
+
+	def tearDown( self ):
+		shutil.rmtree( self.path )
+
+	def test_cache_hit_resume( self ):
+		data = "abcdbcabcdaaaabaaaaaa" * 20
+		cache = GrammarCache( self.path )
+		s, how = cache.build( data[:200] )
+		self.assertEqual( how, 'miss' )
+		s, how = GrammarCache( self.path ).build( data[:200] )
+		self.assertEqual( how, 'hit' )
+		self.assertEqual( ''.join( s.walk() ), data[:200] )
+		s, how = cache.build( data )
+		self.assertEqual( how, 'resume' )
+		self.assertEqual( ''.join( s.walk() ), data )
+		self.assertEqual( s.verify(), [] )
+		s, how = cache.build( data, index=ArrayIndex() )
+		self.assertEqual( how, 'miss' ) # other parameters
+		s, how = cache.build( "x" + data[:200] )
+		self.assertEqual( how, 'miss' ) # no prefix
+		self.assertEqual( cache.stats()['grammars'], 4 )
+
+	def test_cache_recency( self ):
+		cache = GrammarCache( self.path )
+		cache.build( "abcabc" )
+		cache.build( "xyzxyz" )
+		key = cache.key( "abcabc", {'index': 'Index'} )
+		used = cache.catalog[key]['used']
+		time.sleep( 0.01 )
+		self.assertEqual( GrammarCache( self.path ).build( "abcabc" )[1], 'hit' )
+		self.assertTrue( GrammarCache( self.path ).catalog[key]['used'] > used )
+
+	def test_cache_prefix( self ):
+		cache = GrammarCache( self.path )
+		data = "abcdbcabcdaaaabaaaaaa" * 5
+		for length in ( 0, 10, 30, 31, 60 ):
+			cache.build( data[:length] )
+		cache.build( "x" * 45 )
+		params = {'index': 'Index'}
+		self.assertEqual( cache.prefix( data, params ), ( cache.key( data[:60], params ), 60 ) )
+		self.assertEqual( cache.prefix( data[:59], params ), ( cache.key( data[:31], params ), 31 ) )
+		self.assertEqual( cache.prefix( "y" * 20, params ), ( cache.key( "", params ), 0 ) )
+
+	def test_cache_corrupt( self ):
+		cache = GrammarCache( self.path )
+		cache.build( "abcabcabc" )
+		cache.build( "xyzxyz" )
+		params = {'index': 'Index'}
+		for data, garbage in ( ("abcabcabc", None), ("xyzxyz", "garbage") ):
+			name = cache.filename( cache.key( data, params ) )
+			with open( name, 'rb' ) as f: saved = f.read()
+			with open( name, 'wb' ) as f: f.write( garbage or saved[:len( saved ) // 2] )
+			s, how = GrammarCache( self.path ).build( data )
+			self.assertEqual( how, 'miss' )
+			self.assertEqual( ''.join( s.walk() ), data )
+			self.assertEqual( s.verify(), [] )
+			self.assertEqual( len( s.index ), sum( len( r.dump() ) - 1 for r in s.rules.values() ) )
+			self.assertEqual( GrammarCache( self.path ).build( data )[1], 'hit' )
+
+	def test_cache_evict( self ):
+		cache = GrammarCache( self.path, maxbytes=0 )
+		cache.build( "abcabc" )
+		self.assertEqual( cache.stats()['grammars'], 0 )
+		self.assertEqual( cache.stats()['evictions'], 1 )
+		self.assertEqual( os.listdir( self.path ), ['catalog.json'] )
+		cache.maxbytes = 1<<20
+		cache.build( "abcabc" )
+		cache.build( "abcabcd" )
+		size = cache.stats()['bytes']
+		cache.maxbytes = size - 1
+		cache.build( "xyzxyz" )
+		self.assertTrue( cache.stats()['bytes'] < size )
+		self.assertTrue( cache.key( "abcabc", {'index': 'Index'} ) not in cache.catalog ) # oldest
+		self.assertEqual( cache.build( "xyzxyz" )[1], 'hit' )
+
+
+#########################################################################################
+class Test_EF_NCD( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_ncd_matrix( self ):
+		inputs = [ "abcdbcabcd" * 8, "abcdbcabcd" * 7 + "abcd", "xyzzyxxyzz" * 8, "" ]
+		serial = ncd_sqt.BatchNCD( inputs, workers=0, blocksize=2 )
+		m = serial.matrix()
+		self.assertEqual( serial.stats()['pairs'], 6 )
+		cx, cy = [ncd_sqt.snapshot( x )[0] for x in inputs[:2]]
+		sizes = []
+		for x, y in ( inputs[:2], inputs[1::-1] ):
+			s = Sequitur()
+			for c in x + y: s.append( c )
+			sizes.append( grammarsize( s ) )
+		self.assertNotEqual( sizes[0], sizes[1] )
+		self.assertEqual( m[0][1], ncd_sqt.ncd( cx, cy, min( sizes ) ) )
+		self.assertEqual( m[1][0], m[0][1] )
+		reverse = ncd_sqt.BatchNCD( inputs[::-1], workers=0 ).matrix()
+		self.assertEqual( [row[::-1] for row in reverse[::-1]], m ) # independent of input order
+		self.assertTrue( m[0][1] < m[0][2] )
+		self.assertEqual( ncd_sqt.BatchNCD( inputs, workers=2, blocksize=1 ).matrix(), m )
+
+
+#########################################################################################
+class Test_EG_Tokens( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_tokenize_chunks( self ):
+		text = "GET /index.html 200\nGET /about.html 404\n" * 3
+		for splitter in token_sqt.splitters:
+			whole = list( token_sqt.tokenize( [text], splitter ) )
+			self.assertEqual( ''.join( whole ), text )
+			chunks = [text[i:i+7] for i in xrange( 0, len( text ), 7 )]
+			self.assertEqual( list( token_sqt.tokenize( chunks, splitter ) ), whole )
+		self.assertEqual( list( token_sqt.tokenize( ["a=1, b", "c=22"], 'fields' ) ),
+			['a', '=', '1', ', ', 'bc', '=', '22'] )
+
+	def test_token_grammar( self ):
+		table = token_sqt.TokenTable()
+		text = "GET /index.html 200\nGET /about.html 404\n" * 3
+		s = token_sqt.build( [text], table )
+		self.assertEqual( ''.join( s.walk() ), text )
+		self.assertTrue( all( isinstance( x, int ) for x in s.S.walk() ) )
+		self.assertEqual( s.verify(), [] )
+		self.assertTrue( "'GET'" in str(s) )
+		self.assertEqual( s.spell_rules().count( text ), 1 )
+		tokens = len( table )
+		other = token_sqt.build( ["GET /index.html 500\n"], table )
+		self.assertEqual( len( table ), tokens + 1 ) # only 500 is new
+		self.assertEqual( ''.join( other.walk() ), "GET /index.html 500\n" )
+
+
+#########################################################################################
+class Test_EH_Replay( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_replay_pipe( self ):
+		data = "abcdbcabcdaaaabaaaaaa" * 30
+		s = Sequitur()
+		for c in data[:100]: s.append( c )
+		snapshot = cStringIO.StringIO()
+		s.save( snapshot )
+		r, w = os.pipe()
+		def builder():
+			os.close( r )
+			with os.fdopen( w, 'wb' ) as out:
+				delta = DeltaLog( out, batchsize=16 )
+				s.subscribe( delta )
+				for c in data[100:]: s.append( c )
+				delta.sync()
+				self.assertEqual( delta.stats()['appended'], len( data ) - 100 )
+		p = multiprocessing.Process( target=builder )
+		p.start()
+		os.close( w )
+		replay = Replay( snapshot.getvalue() )
+		with os.fdopen( r, 'rb' ) as f:
+			replay.follow( f )
+		p.join()
+		self.assertEqual( p.exitcode, 0 )
+		self.assertEqual( replay.stats()['replayed'], len( data ) - 100 )
+		self.assertEqual( ''.join( replay.s.walk() ), data )
+		full = Sequitur()
+		for c in data: full.append( c )
+		self.assertEqual( sorted( str(replay.s).split('\n') ), sorted( str(full).split('\n') ) )
+
+	def test_replay_divergence( self ):
+		s = Sequitur()
+		f = cStringIO.StringIO()
+		s.save( f )
+		replay = Replay( f.getvalue() )
+		replay.replay( [ ('a','',()), ('b','',()), ('a','',()) ] )
+		with self.assertRaises( ReplicationError ):
+			replay.replay( [ ('b','MRAA',(-1,1,2,2)) ] )
+
+
+#########################################################################################
+class Test_EI_RePair( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_repair_pairs( self ):
+		top, rules = repair_sqt.pairs( [0,1,0,1,0,1,0,1,2], 3 )
+		self.assertEqual( rules, [(0,1), (3,3)] )
+		self.assertEqual( top, [4,4,2] )
+		top, rules = repair_sqt.pairs( [0,1,0,1,0,1,2], 3 )
+		self.assertEqual( top, [3,3,3,2] ) # 3,3 overlaps itself
+		self.assertEqual( repair_sqt.pairs( [], 0 ), ([], []) )
+		self.assertEqual( repair_sqt.pairs( [2,2,2], 3 ), ([2,2,2], []) ) # overlapping
+
+	def test_repair_grammar( self ):
+		data = "abcdbcabcdaaaabaaaaaa" * 20
+		s = repair_sqt.build( data )
+		self.assertEqual( ''.join( s.walk() ), data )
+		for rule in s.rules.values():
+			if rule is not s.S: self.assertTrue( rule.refcount() >= 2 )
+		self.assertEqual( s.spell_rules().count( data ), 1 )
+		f = cStringIO.StringIO()
+		s.save( f )
+		loaded = Sequitur.load( cStringIO.StringIO( f.getvalue() ) )
+		self.assertEqual( ''.join( loaded.walk() ), data )
+		for grammar in ( s, loaded ):
+			with self.assertRaises( RuleError ): grammar.append( 'a' )
+		self.assertEqual( ''.join( loaded.walk() ), data )
+		loaded.clear()
+		for x in "abab": loaded.append( x )
+		self.assertEqual( loaded.verify(), [] )
+		self.assertEqual( [x for x in repair_sqt.build( [] ).walk()], [] )
+
+
+#########################################################################################
+class Test_EJ_Runs( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_runs( self ):
+		data = "ab" + "\0" * 20 + "cdddd" + "e" * 8
+		self.assertEqual( list( run_sqt.runs( data, 5 ) ),
+			['a','b',run_sqt.Run('\0',20),'c','d','d','d','d',run_sqt.Run('e',8)] )
+		self.assertEqual( list( run_sqt.runs( "x" * 3, 2 ) ), [run_sqt.Run('x',3)] )
+		self.assertEqual( list( run_sqt.runs( "", 2 ) ), [] )
+
+	def test_run_grammar( self ):
+		data = ( "abc" + "\0" * 100 + "abc" + "\0" * 64 ) * 10
+		for index in ( Index, ArrayIndex ):
+			s = run_sqt.build( data, index=index() )
+			self.assertEqual( ''.join( s.walk() ), data )
+			self.assertEqual( s.verify(), [] )
+			self.assertTrue( sum( len( r.dump() ) for r in s.rules.values() ) < 40 )
+		f = cStringIO.StringIO()
+		s.save( f )
+		loaded = Sequitur.load( cStringIO.StringIO( f.getvalue() ), decode=run_sqt.expand )
+		self.assertEqual( ''.join( loaded.walk() ), data )
+
+
+#########################################################################################
+class Test_EK_RuleStore( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def build( self, data ):
+		s = Sequitur()
+		for x in data: s.append( x )
+		return s
+
+	def test_rulestore_shared( self ):
+		store = RuleStore()
+		common = "GET /index.html HTTP/1.1 200\n" * 4
+		a = self.build( common + "alpha" * 3 )
+		first = store.put( 'a', a )
+		self.assertEqual( first, len( a.rules ) )
+		b = self.build( common + "beta" * 3 )
+		second = store.put( 'b', b )
+		self.assertTrue( second < len( b.rules ) )
+		self.assertEqual( store.stats()['shared'], len( b.rules ) - second )
+		self.assertEqual( store.names(), ['a','b'] )
+		for name, data in ( ('a', common + "alpha" * 3), ('b', common + "beta" * 3) ):
+			s = store.get( name )
+			self.assertEqual( ''.join( s.walk() ), data )
+			self.assertEqual( s.S.fingerprint(), self.build( data ).S.fingerprint() )
+		self.assertTrue( store.stats()['cached'] > 0 )
+		with self.assertRaises( KeyError ): store.get( 'c' )
+
+	def test_rulestore_equal_expansions( self ):
+		data = "cccccccccccbbbccccbbcccc"
+		s = self.build( data )
+		fps = [rule.fingerprint() for rule in s.rules.values()]
+		self.assertEqual( len( set( fps ) ), len( fps ) - 1 ) # r2: r1 r1 and r5: r3 'c'
+		store = RuleStore()
+		self.assertEqual( store.put( 'c', s ), len( s.rules ) - 1 )
+		loaded = store.get( 'c' )
+		self.assertEqual( len( loaded.rules ), len( s.rules ) - 1 )
+		self.assertEqual( ''.join( loaded.walk() ), data )
+		self.assertEqual( len( loaded.index ), 0 )
+		with self.assertRaises( RuleError ): loaded.append( 'c' )
+
+
+#########################################################################################
+class Test_EL_Export( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def setUp( self ):
+		self.s = Sequitur()
+		for x in "abcdbcabcd\xff" * 3: self.s.append( x )
+
+	def test_export_jsonl( self ):
+		f = cStringIO.StringIO()
+		written = export_sqt.export( self.s, f, 'jsonl', bufsize=16 )
+		self.assertEqual( written, len( f.getvalue() ) )
+		records = [json.loads( line ) for line in f.getvalue().splitlines()]
+		self.assertEqual( len( records ), len( self.s.rules ) )
+		self.assertEqual( records[0]['id'], self.s.S.id )
+		self.assertEqual( records[0]['length'], 33 )
+		byid = dict( (r['id'], r) for r in records )
+		def expand( id ):
+			out = ''
+			for ref in byid[id]['refs']:
+				out += expand( ref['rule'] ) if isinstance( ref, dict ) else ref.encode( 'latin-1' )
+			return out
+		self.assertEqual( expand( self.s.S.id ), "abcdbcabcd\xff" * 3 )
+		for id, record in byid.iteritems():
+			self.assertEqual( record['length'], len( expand( id ) ) )
+		self.assertTrue( all( rule.fp is None for rule in self.s.rules.values() ) ) # no fingerprints needed
+
+	def test_export_dot_csv( self ):
+		f = cStringIO.StringIO()
+		export_sqt.export( self.s, f, 'dot', bufsize=16 )
+		dot = f.getvalue()
+		self.assertTrue( dot.startswith( 'strict digraph' ) and dot.endswith( '}\n' ) )
+		A = self.s.S.dump()[0]
+		self.assertTrue( '\t%s -> %s;\n' % (self.s.S.id, A.id) in dot )
+		f = cStringIO.StringIO()
+		export_sqt.export( self.s, f, 'csv', bufsize=16 )
+		rows = list( csv.reader( cStringIO.StringIO( f.getvalue() ) ) )
+		self.assertEqual( rows[0], ['id','uses','length','rhs'] )
+		self.assertEqual( sorted( "%s: %s" % (r[0], r[3]) for r in rows[1:] ), sorted( str(self.s).split('\n') ) )
+
+	def test_export_chunks( self ):
+		rnd = random.Random( 0 )
+		s = Sequitur()
+		for i in xrange( 20000 ): s.append( chr( rnd.randint( 0, 255 ) ) )
+		class Sink( object ):
+			largest = 0
+			def write( self, chunk ): self.largest = max( self.largest, len( chunk ) )
+		for format in export_sqt.writers:
+			sink = Sink()
+			self.assertTrue( export_sqt.export( s, sink, format, bufsize=4096 ) > 40000 )
+			self.assertTrue( sink.largest < 4096 + 64 )
+
+
+#########################################################################################
+class Test_EM_Estimate( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def test_windows( self ):
+		data = ''.join( chr( i % 256 ) for i in xrange( 1000 ) )
+		self.assertEqual( estimate_sqt.windows( data, 4, 300 ), [data[:300], data[300:600], data[600:900], data[900:]] )
+		w = estimate_sqt.windows( data, 3, 100 )
+		self.assertEqual( w, [data[:100], data[450:550], data[900:]] )
+		self.assertEqual( estimate_sqt.repeated( "abab" ), 1.0 - 2.0 / 3 )
+
+	def test_estimate( self ):
+		rnd = random.Random( 0 )
+		noise = ''.join( chr( rnd.randint( 0, 255 ) ) for i in xrange( 20000 ) )
+		result = estimate_sqt.estimate( noise, count=4, size=1024 )
+		self.assertEqual( result['decision'], 'skip' )
+		self.assertEqual( result['built'], 0 )
+		text = "GET /index.html HTTP/1.1 200\n" * 400
+		s = Sequitur()
+		for x in "abcabc": s.append( x )
+		result = estimate_sqt.estimate( text, count=4, size=1024 )
+		self.assertIs( Sequitur.active, s )
+		self.assertIs( Rule.rules, s.rules )
+		for x in "abcabc": s.append( x )
+		self.assertEqual( ''.join( s.walk() ), "abcabc" * 2 )
+		self.assertEqual( s.verify(), [] )
+		self.assertEqual( result['decision'], 'build' )
+		self.assertEqual( result['windows'], 4 )
+		self.assertTrue( result['ratio'] < 0.2 )
+		self.assertEqual( estimate_sqt.estimate( "" )['decision'], 'skip' )
+
+
+#########################################################################################
+class Test_EN_Expand( unittest.TestCase ):
+
+	@classmethod
+	def setUpClass( cls ):
+		log.basicConfig( level=log.ERROR )
+		log.info( " ##### BEGIN %s ##############################################" % cls )
+
+	@classmethod
+	def tearDownClass( cls ):
+		log.info( " ##### END %s ##############" % cls )
+
+	def setUp( self ):
+		fd, self.filename = tempfile.mkstemp()
+		os.close( fd )
+
+	def tearDown( self ):
+		os.remove( self.filename )
+
+	def test_expand_ranges( self ):
+		data = "abcdbcabcdaaaabaaaaaa" * 20
+		s = Sequitur()
+		for x in data: s.append( x )
+		for cachemax in ( 0, 8, 256 ):
+			flat = expand_sqt.Flat( s, cachemax=cachemax )
+			self.assertEqual( len( flat ), len( data ) )
+			for start, end in ( (0,len( data )), (5,6), (17,333), (100,100), (419,420) ):
+				out = []
+				flat.expand( start, end, out.append )
+				self.assertEqual( ''.join( out ), data[start:end] )
+		tokens = token_sqt.build( ["one two three two three one two three"] )
+		out = []
+		expand_sqt.Flat( tokens, cachemax=0 ).expand( 2, 12, out.append )
+		self.assertEqual( ''.join( out ), "e two thre" )
+
+	def test_decompress( self ):
+		data = "abcdbcabcdaaaabaaaaaa" * 20 + "z" * 3000
+		s = Sequitur()
+		for x in data: s.append( x )
+		for workers, ranges in ( (0, 7), (2, None) ):
+			self.assertEqual( expand_sqt.decompress( s, self.filename, workers, ranges ), len( data ) )
+			with open( self.filename, 'rb' ) as f:
+				self.assertEqual( f.read(), data )
+		self.assertEqual( expand_sqt.decompress( Sequitur(), self.filename, 0 ), 0 )
+		self.assertEqual( os.path.getsize( self.filename ), 0 )
+
 
 #########################################################################################
 if __name__ == '__main__':
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import Queue
+import threading
+import logging as log
+from sqt import Sequitur
+
+# grammars share class-wide state in sqt, so builders take turns.
+# once this module is loaded, creating, appending to, clearing, saving
+# and restoring any Sequitur take this lock and activate the grammar
+# themselves. walking a grammar or touching its rules directly while
+# other threads build needs the lock held around it.
+buildlock = threading.RLock()
+Sequitur.lock = buildlock
+
+
+class IngestError( Exception ):
+	pass
+
+class ThreadedSequitur( object ):
+	"""Thread-safe front-end to a Sequitur grammar.
+	   producers enqueue chunks into a bounded queue, a single builder
+	   thread drains it in batches into the grammar.
+	   the builder holds buildlock for a batch at a time.
+	"""
+
+	def __init__( self, sequitur=None, maxsize=1024, batchsize=64 ):
+		if sequitur is None: sequitur = Sequitur()
+		self.s = sequitur
+		self.queue = Queue.Queue( maxsize )
+		self.batchsize = batchsize
+		self.closed = False
+		self.putting = 0 # puts between the closed check and the enqueue
+		self.admission = threading.Condition() # guards closed, putting and the counters
+		self.error = None
+		self.maxdepth = 0
+		self.batches = 0
+		self.chunks = 0
+		self.bytes = 0
+		self.buildtime = 0.0
+		self.blocked = 0
+		self.started = time.time()
+		self.builder = threading.Thread( target=self.build, name="sequitur-builder" )
+		self.builder.daemon = True
+		self.builder.start()
+
+	def put( self, chunk, timeout=None ):
+		"""enqueues chunk for the builder. blocks while the queue is full.
+		   a put that passed the closed check enqueues before close() does.
+		"""
+		admission = self.admission
+		with admission:
+			if self.closed:
+				raise IngestError( "put on closed %s" % repr(self) )
+			if self.queue.full(): self.blocked += 1
+			self.putting += 1
+		try:
+			self.queue.put( chunk, True, timeout )
+		finally:
+			with admission:
+				self.putting -= 1
+				depth = self.queue.qsize()
+				if depth > self.maxdepth: self.maxdepth = depth
+				if not self.putting: admission.notify_all()
+
+	def build( self ):
+		"""builder thread main loop. drains the queue in batches until closed."""
+		queue = self.queue
+		while True:
+			batch = [queue.get()]
+			try:
+				while len( batch ) < self.batchsize:
+					batch.append( queue.get_nowait() )
+			except Queue.Empty:
+				pass
+			done = False
+			try:
+				if self.error is None:
+					self.apply( batch )
+			except Exception as e:
+				log.error( "builder failed: %s" % repr(e) )
+				self.error = e
+			for chunk in batch:
+				if chunk is None: done = True
+				queue.task_done()
+			if done: return
+
+	def apply( self, batch ):
+		"""appends a batch of chunks to the grammar."""
+		start = time.time()
+		with buildlock:
+			self.s.activate()
+			for chunk in batch:
+				if chunk is None: continue
+				for symbol in chunk:
+					self.s.append( symbol )
+				self.chunks += 1
+				self.bytes += len( chunk )
+		self.batches += 1
+		self.buildtime += time.time() - start
+
+	def check( self ):
+		if self.error is not None:
+			raise IngestError( "builder failed: %s" % repr(self.error) )
+
+	def flush( self ):
+		"""blocks until every chunk enqueued so far is in the grammar."""
+		self.queue.join()
+		self.check()
+
+	def close( self ):
+		"""flushes, stops the builder thread and returns the grammar."""
+		admission = self.admission
+		with admission:
+			if not self.closed:
+				self.closed = True
+				while self.putting: admission.wait()
+				self.queue.put( None )
+		self.builder.join()
+		self.check()
+		return self.s
+
+	def depth( self ):
+		"""returns number of chunks waiting in the queue."""
+		return self.queue.qsize()
+
+	def stats( self ):
+		"""returns queue-depth and throughput figures."""
+		elapsed = time.time() - self.started
+		return {
+			'depth': self.depth(),
+			'maxdepth': self.maxdepth,
+			'blocked': self.blocked,
+			'batches': self.batches,
+			'chunks': self.chunks,
+			'bytes': self.bytes,
+			'buildtime': self.buildtime,
+			'build_bytes_per_sec': self.bytes / self.buildtime if self.buildtime else 0.0,
+			'bytes_per_sec': self.bytes / elapsed if elapsed else 0.0,
+		}
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filename = sys.argv[1]
+		producers = int( sys.argv[2] ) if len( sys.argv ) > 2 else 4
+	except:
+		log.fatal( "usage: %s filename [producers]" % sys.argv[0] )
+		sys.exit(5)
+
+	with open( filename ) as f:
+		data = f.read()
+
+	t = ThreadedSequitur( maxsize=64 )
+	def produce( n ):
+		for i in xrange( n * 256, len( data ), producers * 256 ):
+			t.put( data[i:i+256] )
+	threads = [threading.Thread( target=produce, args=(n,) ) for n in xrange( producers )]
+	for th in threads: th.start()
+	for th in threads: th.join()
+	t.close()
+	for k, v in sorted( t.stats().items() ):
+		print "%-20s %s" % (k, v)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import re
+import sys
+import time
+import logging as log
+from sqt import Sequitur
+
+# splitting rules: regular expressions whose matches cover any text
+# without gaps, so the tokens joined give back the input
+splitters = {
+	'words': re.compile( r'\w+|\s+|[^\w\s]+' ),
+	'fields': re.compile( r'[^\s,;|=:]+|[\s,;|=:]+' ),
+	'lines': re.compile( r'[^\n]*\n|[^\n]+' ),
+	'chars': re.compile( r'.', re.DOTALL ),
+}
+
+
+class TokenTable( object ):
+	"""Interns tokens to small integer terminals.
+	   one table can be shared by several grammars, so equal tokens are
+	   equal terminals across them.
+	"""
+
+	def __init__( self ):
+		self.ids = {}
+		self.tokens = []
+
+	def intern( self, token ):
+		"""returns the terminal of token, assigning the next free one if new."""
+		id = self.ids.get( token )
+		if id is None:
+			id = self.ids[token] = len( self.tokens )
+			self.tokens.append( token )
+		return id
+
+	def text( self, id ):
+		"""returns the token of terminal id."""
+		return self.tokens[id]
+
+	def __len__( self ):
+		return len( self.tokens )
+
+def tokenize( chunks, splitter='words' ):
+	"""iterator yielding the tokens of an iterable of text chunks.
+	   a token running up to the end of a chunk is held back and
+	   completed with the next one.
+	"""
+	if isinstance( splitter, basestring ): splitter = splitters[splitter]
+	rest = ''
+	for chunk in chunks:
+		text = rest + chunk
+		tokens = [m.group() for m in splitter.finditer( text )]
+		rest = tokens.pop() if tokens else ''
+		for token in tokens: yield token
+	for m in splitter.finditer( rest ): yield m.group()
+
+def terminals( tokens, table ):
+	"""iterator yielding the interned terminals of tokens."""
+	intern = table.intern
+	for token in tokens: yield intern( token )
+
+def build( chunks, table=None, splitter='words', index=None ):
+	"""builds the token-level grammar of an iterable of text chunks.
+	   returns the grammar, decoding through table on output.
+	"""
+	if table is None: table = TokenTable()
+	s = Sequitur( index=index, decode=table.text )
+	for id in terminals( tokenize( chunks, splitter ), table ):
+		s.append( id )
+	return s
+
+def chunked( f, size=65536 ):
+	"""iterator yielding file object f in chunks of size bytes."""
+	while True:
+		chunk = f.read( size )
+		if not chunk: return
+		yield chunk
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	try:
+		filename = sys.argv[1]
+		splitter = sys.argv[2] if len( sys.argv ) > 2 else 'words'
+		if splitter not in splitters: raise ValueError( splitter )
+	except:
+		log.fatal( "usage: %s filename [%s]" % (sys.argv[0], '|'.join( sorted( splitters ) )) )
+		sys.exit(5)
+
+	table = TokenTable()
+	start = time.time()
+	with open( filename ) as f:
+		s = build( chunked( f ), table, splitter )
+	elapsed = time.time() - start
+	symbols = sum( 1 for x in s.S.walk() )
+	print "%-10s %s" % ('tokens', symbols)
+	print "%-10s %s" % ('distinct', len( table ))
+	print "%-10s %s" % ('rules', len( s.rules ))
+	print "%-10s %.0f" % ('tokens/s', symbols / elapsed if elapsed else 0.0)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import zlib
+import struct
+import marshal
+from array import array
+import logging as log
+from sqt import Sequitur, Index, ArrayIndex
+
+magic = "sqt-trace 1\n"
+frame = struct.Struct( '<I' )
+
+# one-letter codes of the traced grammar events
+codes = { 'makeunique': 'M', 'apply': 'A', 'dissolve': 'D', 'delete': 'X' }
+names = dict( (v, k) for k, v in codes.iteritems() )
+
+
+class TraceRecorder( object ):
+	"""Grammar listener writing appended symbols with the events they
+	   caused to a file object.
+	   a trace is a magic line followed by length-prefixed, zlib-compressed
+	   marshalled batches.
+	   a batch holds its records column by column: appended symbols,
+	   number of events per symbol, event codes and rule numbers.
+	"""
+
+	magic = magic
+	codes = codes
+
+	def __init__( self, f, batchsize=1024 ):
+		self.f = f
+		self.batchsize = batchsize
+		self.batch = []
+		self.record = None
+		self.written = len( self.magic )
+		f.write( self.magic )
+
+	def __call__( self, event, *args ):
+		if event == 'append':
+			self.push()
+			self.record = ( args[0], [], [] )
+		elif event in self.codes and self.record is not None:
+			self.record[1].append( self.codes[event] )
+			self.record[2].append( args[0].num if event != 'makeunique' else -1 )
+
+	def push( self ):
+		if self.record is None: return
+		symbol, events, nums = self.record
+		self.batch.append( ( symbol, ''.join( events ), tuple( nums ) ) )
+		self.record = None
+		if len( self.batch ) >= self.batchsize: self.flush()
+
+	def flush( self ):
+		"""writes pending records."""
+		if not self.batch: return
+		symbols = [r[0] for r in self.batch]
+		counts = array( 'H', [len( r[1] ) for r in self.batch] )
+		events = ''.join( r[1] for r in self.batch )
+		nums = array( 'i', [n for r in self.batch for n in r[2]] )
+		columns = marshal.dumps( ( symbols, counts.tostring(), events, nums.tostring() ) )
+		columns = zlib.compress( columns )
+		self.f.write( frame.pack( len( columns ) ) )
+		self.f.write( columns )
+		self.written += frame.size + len( columns )
+		self.batch = []
+
+	def close( self ):
+		"""writes the last record."""
+		self.push()
+		self.flush()
+
+def read( f, magic=magic ):
+	"""iterator yielding the records of the trace in file object f."""
+	if f.read( len( magic ) ) != magic:
+		raise ValueError( "not a Sequitur trace" )
+	while True:
+		size = f.read( frame.size )
+		if not size: return
+		batch = f.read( frame.unpack( size )[0] )
+		symbols, counts, events, nums = marshal.loads( zlib.decompress( batch ) )
+		counts = array( 'H', counts )
+		nums = array( 'i', nums )
+		at = 0
+		for i in xrange( len( symbols ) ):
+			n = counts[i]
+			yield ( symbols[i], events[at:at+n], tuple( nums[at:at+n] ) )
+			at += n
+
+def record( data, f, index=None ):
+	"""builds a grammar of data, tracing to file object f. returns the grammar."""
+	s = Sequitur( index=index )
+	recorder = TraceRecorder( f )
+	s.subscribe( recorder )
+	for symbol in data:
+		s.append( symbol )
+	recorder.close()
+	s.unsubscribe( recorder )
+	return s
+
+def replay( f, index=None ):
+	"""re-drives the input of the trace in file object f into a new grammar
+	   using index backend index, diffs the resulting events against the
+	   trace and returns a report with per-phase timing.
+	"""
+	report = { 'timing': {} }
+	timing = report['timing']
+
+	start = time.time()
+	records = list( read( f ) )
+	timing['read'] = time.time() - start
+
+	s = Sequitur( index=index )
+	events = []
+	def listener( event, *args ):
+		if event == 'append':
+			events.append( ( [], [] ) )
+		elif event in codes:
+			events[-1][0].append( codes[event] )
+			events[-1][1].append( args[0].num if event != 'makeunique' else -1 )
+	s.subscribe( listener )
+	start = time.time()
+	for symbol, _, _ in records:
+		s.append( symbol )
+	timing['build'] = time.time() - start
+	s.unsubscribe( listener )
+
+	start = time.time()
+	divergence = None
+	counts = dict( (name, 0) for name in codes )
+	cascade = ( 0, None )
+	for i in xrange( len( records ) ):
+		symbol, recorded, nums = records[i]
+		replayed = ''.join( events[i][0] )
+		if divergence is None and ( replayed != recorded or tuple( events[i][1] ) != nums ):
+			divergence = { 'position': i, 'recorded': recorded, 'replayed': replayed }
+		for code in recorded:
+			counts[names[code]] += 1
+		if len( recorded ) > cascade[0]:
+			cascade = ( len( recorded ), i )
+	timing['diff'] = time.time() - start
+
+	start = time.time()
+	walked = 0
+	for x, record in zip( s.walk(), records ):
+		if x != record[0]: break
+		walked += 1
+	timing['walk'] = time.time() - start
+
+	report['symbols'] = len( records )
+	report['rules'] = len( s.rules )
+	report['events'] = counts
+	report['largest_cascade'] = { 'events': cascade[0], 'position': cascade[1] }
+	report['divergence'] = divergence
+	report['walk_ok'] = walked == len( records )
+	return report
+
+def main():
+	log.basicConfig( level=log.WARNING )
+	indexes = { 'Index': Index, 'ArrayIndex': ArrayIndex }
+	try:
+		command = sys.argv[1]
+		if command == 'record':
+			inputname, tracename = sys.argv[2:4]
+		elif command == 'replay':
+			tracename = sys.argv[2]
+			index = indexes[sys.argv[3] if len( sys.argv ) > 3 else 'Index']
+		else:
+			raise ValueError( command )
+	except:
+		log.fatal( "usage: %s record input trace | replay trace [%s]" % (sys.argv[0], '|'.join( indexes )) )
+		sys.exit(5)
+
+	if command == 'record':
+		with open( inputname ) as f:
+			data = bytearray( f.read() )
+		with open( tracename, 'wb' ) as f:
+			record( ( chr(byte) for byte in data ), f )
+	else:
+		with open( tracename, 'rb' ) as f:
+			report = replay( f, index=index() )
+		for k, v in sorted( report.items() ):
+			print "%-16s %s" % (k, v)
+		if report['divergence'] is not None or not report['walk_ok']:
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()